@@ -0,0 +1,64 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from initData import parsers
+
+# synthetic SHL Motion file: timestamp + 22 sensor channels per row
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='initData parser backends benchmark')
+    parser.add_argument('--rows', default=100_000_000, type=int, help='rows of the synthetic Motion file')
+    parser.add_argument('--threads', default=os.cpu_count(), type=int, help='threads of the block parser')
+    parser.add_argument('--path', default=None, help='scratch folder, a temporary one if not given')
+    args = parser.parse_args()
+
+    scratch = args.path is None
+    if scratch:
+        args.path = tempfile.mkdtemp()
+
+    if not os.path.exists(args.path):
+        os.makedirs(args.path)
+
+    src = os.path.join(args.path, 'Motion.txt')
+    chunk = 100_000
+
+    if not os.path.exists(src):
+        rng = np.random.default_rng(0)
+        x = np.concatenate((1498118400000 + 10 * np.arange(chunk)[:, np.newaxis],
+                            rng.normal(0, 5, size=(chunk, 22))), axis=1)
+        x[::997, 4:7] = np.nan
+
+        with open(src, 'w') as f:
+            lines = []
+            for row in x:
+                lines.append('%d ' % row[0] + ' '.join('%.6e' % v for v in row[1:]))
+            block = '\n'.join(lines) + '\n'
+
+            for _ in range(args.rows // chunk):
+                f.write(block)
+            f.write(''.join(line + '\n' for line in lines[:args.rows % chunk]))
+
+    print('source: %s (%.2f GB)' % (src, os.path.getsize(src) / 1e9))
+
+    outputs = {}
+    for name, threads in [('pandas', 1), ('block', args.threads)]:
+        dst = os.path.join(args.path, 'motion_' + name + '.mmap')
+
+        start = time.time()
+        lines = parsers[name](src, dst, [0, 1, 2, 3], np.float64, threads)
+        elapsed = time.time() - start
+
+        print('%-6s threads=%-3d rows=%d  %.1f s  %.2f Mrows/s' % (name, threads, lines, elapsed,
+                                                                lines / elapsed / 1e6))
+        outputs[name] = np.memmap(dst, mode='r', dtype=np.float64, shape=(lines, 4))
+
+    same = all(np.array_equal(outputs['pandas'][i: i + chunk], outputs['block'][i: i + chunk], equal_nan=True)
+               for i in range(0, outputs['pandas'].shape[0], chunk))
+    print('identical output: ' + str(same))
+
+    del outputs
+    if scratch:
+        shutil.rmtree(args.path)
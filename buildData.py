@@ -7,9 +7,40 @@ import copy
 import shutil
 import scipy.signal as sn
 import yaml
-from configParser import Parser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from configParser import Parser, stage_fingerprint, STAGE_ARGS
 from initData import initData
-from scipy.interpolate import interp1d
+from dataManifest import dataManifest
+from buildProfile import buildProfile
+from mmapContainer import checksum, combine_checksums, create_mmap, create_windows, nbytes, open_mmap, \
+    read_header, resize_mmap, seal_mmap, seal_folder, set_threads, unseal_folder, validate, write_header, \
+    CHUNK, CHUNK_ROWS
+
+# per-day stages recorded in the manifest and the stage they belong to
+DAY_STAGES = {
+    'loc_drop': 'drop',
+    'acc_drop': 'drop',
+    'sampling_location': 'sampling',
+    'sampling_acceleration': 'sampling'
+}
+
+# buildData and the shared arguments of the jobs of the stage being run,
+# inherited by forked workers instead of being pickled
+shared = None
+
+
+def run_job(task):
+    stage, job = task
+    builder, args = shared
+
+    # the workers already use the cores, chunks are compressed serially
+    set_threads(1)
+    builder.profile.records = []
+    builder.profile.frames = []
+
+    return builder.run_day(stage, args, job), builder.profile.records
+
 
 class buildData:
     def __init__(self,
@@ -66,16 +97,297 @@ class buildData:
             except OSError as e:
                 print("Error: %s - %s." % (e.filename, e.strerror))
 
-        self.data = initData(args)
-        self.location, self.acceleration, self.labels = self.data(verbose)
+        self.profile = buildProfile()
+        set_threads(args.data_args['parserThreads'])
+
+        with self.profile.measure('ingest'):
+            self.data = initData(args)
+            self.location, self.acceleration, self.labels = self.data(verbose)
 
         self.verbose = verbose
         self.n_acc = self.data.n_acc
         self.n_loc = self.data.n_loc
+        self.fingerprints = {stage: stage_fingerprint(args.data_args, stage) for stage, _ in STAGE_ARGS}
+
+        # the sampling folder holds a file per rate, the pyramid rates are
+        # sampled in the same pass as the configured one
+        self.rates = {
+            'sampling_acceleration': sorted({args.data_args['accSamplingRate']} |
+                                            set(args.data_args.get('accSamplingPyramid') or [])),
+            'sampling_location': sorted({args.data_args['gpsSamplingRate']} |
+                                        set(args.data_args.get('gpsSamplingPyramid') or []))
+        }
+
+        self.manifest = dataManifest(self.path)
+        for user, days in self.data.files.items():
+            for day in days:
+                self.manifest.set_day(user, day, self.data.day_sources(user, day))
 
         if self.verbose:
             self.print_n()
 
+    def run_day(self, stage, args, job):
+        with self.profile.measure(stage, job[0], job[1]):
+            return getattr(self, stage + '_day')(*args, *job)
+
+    def run(self, stage, jobs, *args):
+        # calls the stage_day method with (*args, user, day, ...) for every
+        # per-day job, across data_args['workers'] processes. Jobs write only
+        # their own files or their own rows of a shared container and
+        # return small results, every finished job is checkpointed
+
+        global shared
+
+        workers = self.data.args.data_args.get('workers', 1)
+        results = []
+
+        if not workers or workers <= 1 or len(jobs) <= 1 or \
+                'fork' not in multiprocessing.get_all_start_methods():
+            for job in jobs:
+                results.append(self.run_day(stage, args, job))
+                self.checkpoint(stage, job, results[-1])
+
+            return results
+
+        shared = (self, args)
+        try:
+            # a worker that is killed fails the stage instead of hanging it
+            with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                     mp_context=multiprocessing.get_context('fork')) as executor:
+                for job, (result, records) in zip(jobs, executor.map(run_job, [(stage, job) for job in jobs])):
+                    self.profile.merge(records)
+                    self.checkpoint(stage, job, result)
+                    results.append(result)
+
+            return results
+
+        finally:
+            shared = None
+
+    def checkpoint(self, stage, job, files):
+        # a finished day of a per-day stage is recorded right away, so that
+        # an interrupted build resumes after it
+        if stage in DAY_STAGES:
+            self.manifest.add(self.record(stage), job[0], job[1], files)
+            self.manifest.save()
+
+    def record(self, stage):
+        # manifest records of the current variant of a per-day stage
+        record = stage + '/' + self.fingerprints[DAY_STAGES[stage]]
+
+        if stage in self.rates:
+            record += '/' + ','.join(str(rate) for rate in self.rates[stage])
+
+        return record
+
+    def day_exists(self, stage, user, day):
+        # a day is reused only if its sources are unchanged and every
+        # container it produced is complete and up to date
+
+        exists = self.manifest.done(self.record(stage), user, day)
+
+        if not exists and self.verbose:
+            print('Building ' + stage + ': user' + user + ' ' + day)
+
+        return exists
+
+    def append_mmap(self, path, stage, segments, shape, dtype=np.float64, coding=None, ordered=False):
+        # rows of a concatenated stage are grouped in per-day segments, the
+        # segments still up to date are kept, moved to the front of the file,
+        # and the new or changed ones are appended. With ordered the file
+        # follows the order of segments. Returns the mmap, its segments and
+        # the (offset, segment) pairs still to be written, None if the file
+        # is up to date
+
+        stored = self.manifest.get_segments(path)
+
+        if stored and read_header(path)['attrs'].get('coding') != coding:
+            stored = []
+
+        if stored and (stored == segments or not ordered and sorted(stored) == sorted(segments)):
+            return open_mmap(path, mode='r+', fingerprint=self.fingerprints[stage]), stored, None
+
+        kept = []
+        offset = 0
+
+        if stored:
+            mmap = open_mmap(path, mode='r+', fingerprint=self.fingerprints[stage])
+            raw = getattr(mmap, 'raw', mmap)
+
+            # unsealed before any segment is moved
+            header = read_header(path)
+            header['checksum'] = None
+            write_header(path, header)
+            step = max(1, CHUNK // max(1, raw[:1].nbytes))
+
+            source = 0
+            for segment in stored:
+                rows = segment[3]
+
+                if ordered:
+                    keep = len(kept) < len(segments) and segments[len(kept)] == segment
+
+                else:
+                    keep = segment in segments
+
+                if keep:
+                    if source != offset:
+                        for i in range(0, rows, step):
+                            n = min(step, rows - i)
+                            raw[offset + i: offset + i + n] = raw[source + i: source + i + n]
+
+                    kept.append(segment)
+                    offset += rows
+
+                source += rows
+
+            raw.flush()
+            del mmap, raw
+
+        plan = []
+        order = kept[:]
+        for segment in segments:
+            if segment not in kept:
+                plan.append((offset, segment))
+                order.append(segment)
+                offset += segment[3]
+
+        if stored:
+            mmap = resize_mmap(path, offset)
+
+        else:
+            mmap = create_mmap(path, (offset,) + shape, dtype, stage=stage,
+                               fingerprint=self.fingerprints[stage], coding=coding)
+
+        return mmap, order, plan
+
+    def seal_segments(self, path, mmap, order, plan, attrs=None):
+        # seals a file of append_mmap: only the segments of plan are read
+        # again, the checksum of the file is combined from those of its
+        # segments, kept in the manifest
+
+        if hasattr(mmap, 'flush'):
+            mmap.flush()
+
+        known = self.manifest.get_checksums(path)
+        planned = [segment for _, segment in plan]
+
+        header = read_header(path)
+        row = nbytes(header) // max(1, header['shape'][0])
+
+        crc = '00000000'
+        checksums = []
+        offset = 0
+        for segment in order:
+            size = segment[3] * row
+            segment_crc = known.get(json.dumps(segment))
+
+            if segment in planned or segment_crc is None:
+                segment_crc = checksum(path, size, offset)
+
+            checksums.append(segment_crc)
+            crc = combine_checksums(crc, segment_crc, size)
+            offset += size
+
+        seal_mmap(path, mmap, attrs=attrs, crc=crc)
+        self.manifest.set_segments(path, order, checksums)
+
+    def to_mmap(self, path, exists, stage, shape=None, dtype=np.float64, coding=None):
+        # intermediate stages, optionally compressed. New files are written
+        # as .part files and moved in place by commit_mmap once complete
+        if exists:
+            return open_mmap(path, mode='r', fingerprint=self.fingerprints[stage])
+
+        chunks = CHUNK_ROWS if self.data.args.data_args['tmpStorage'] == 'zlib' else None
+
+        return create_mmap(path + '.part', shape, dtype, stage=stage, fingerprint=self.fingerprints[stage],
+                           coding=coding, chunks=chunks)
+
+    def rate_file(self, path, user, day, name, rate):
+        return self.tmp_file(path, user, day, name + '_' + str(rate))
+
+    def commit_mmap(self, path, mmap, user, day):
+        # the sealed file carries the fingerprint of the sources of its day
+        seal_mmap(path + '.part', mmap, attrs={'day': self.manifest.day_fingerprint(user, day)})
+        os.replace(path + '.part', path)
+
+    def file_done(self, path, stage, user, day):
+        # a file left complete by an interrupted build of the same sources
+        header = validate(path, fingerprint=self.fingerprints[stage])
+
+        return header is not None and header['attrs'].get('day') == self.manifest.day_fingerprint(user, day)
+
+    def acc_coding(self, channels, previous=None):
+        # float32 keeps |error| <= 2^-24 |x|, int16 keeps |error| <= max|x| / 65534
+        # of each channel, user, day and timestamps are always stored exactly.
+        # The previous coding is kept while the new days fit in its scales
+
+        precision = self.data.args.data_args['precision']
+        if precision == 'float64':
+            return None
+
+        signal = {
+            'name': 'signal',
+            'dtype': np.dtype(precision).str,
+            'channels': channels - 3
+        }
+
+        if precision == 'int16':
+            peak = np.zeros(channels - 3)
+            positions = len(self.data.pos)
+            derived = self.data.args.data_args['derivedSignals']
+            freq = int(1. / self.data.args.data_args['accSamplingRate'])
+
+            for user, days in self.data.files.items():
+                for day in days:
+                    channel = 0
+                    for i, position in enumerate(self.data.pos):
+                        current_acc = self.acceleration[user][day][position]
+                        if not current_acc.shape[0]:
+                            channel += len(self.data.acc)
+                            continue
+
+                        for direction in self.data.acc.keys():
+                            peak[channel] = np.fmax(peak[channel], np.nanmax(np.abs(current_acc[:, direction])))
+                            channel += 1
+
+                        if derived:
+                            # the Acc_norm and Jerk of the day, as acc_signal_day
+                            # computes them
+                            xyz = np.stack([np.asarray(current_acc[:, direction])
+                                            for direction in self.data.acc.keys()], axis=1)
+                            norm = np.sqrt(np.sum(xyz ** 2, axis=1))
+                            jerk = np.sqrt(np.sum(((xyz[1:] - xyz[:-1]) * freq) ** 2, axis=1))
+
+                            peak[3 * positions + i] = np.fmax(peak[3 * positions + i], np.nanmax(norm))
+                            if jerk.shape[0]:
+                                peak[4 * positions + i] = np.fmax(peak[4 * positions + i], np.nanmax(jerk))
+
+            peak[~(peak > 0)] = 1.
+            signal['scale'] = list(peak / np.iinfo(np.int16).max)
+
+            if previous and previous[0]['dtype'] == signal['dtype'] and \
+                    all(p >= s for p, s in zip(previous[0]['scale'], signal['scale'])):
+                return previous
+
+        return [
+            signal,
+            {'name': 'user', 'dtype': '|i1', 'channels': 1},
+            {'name': 'day', 'dtype': '<i2', 'channels': 1},
+            {'name': 'time', 'dtype': '<i8', 'channels': 1}
+        ]
+
+    def lbs_coding(self):
+        if self.data.args.data_args['precision'] == 'float64':
+            return None
+
+        return [
+            {'name': 'label', 'dtype': '|i1', 'channels': 1},
+            {'name': 'user', 'dtype': '|i1', 'channels': 1},
+            {'name': 'day', 'dtype': '<i2', 'channels': 1},
+            {'name': 'time', 'dtype': '<i8', 'channels': 1}
+        ]
+
     def print_n(self):
         try:
             print('ACCELERATION SHAPE')
@@ -93,6 +405,57 @@ class buildData:
             print(self.n_loc)
             print('')
 
+    def nan_rows(self, x, start, stop):
+        # rows of x[start:stop] with a NaN value
+        return np.isnan(np.asarray(x[start:stop])).reshape(stop - start, -1).any(axis=1)
+
+    def find_row(self, x, start, nan=False, backwards=False):
+        # first row from start, last row up to start if backwards, that has
+        # a NaN value if nan or none otherwise, scanned in chunks of rows
+
+        n = x.shape[0]
+
+        if not backwards:
+            for first in range(start, n, CHUNK_ROWS):
+                last = min(first + CHUNK_ROWS, n)
+                found = np.flatnonzero(self.nan_rows(x, first, last) == nan)
+
+                if found.size:
+                    return first + int(found[0])
+
+        else:
+            for last in range(start + 1, 0, -CHUNK_ROWS):
+                first = max(last - CHUNK_ROWS, 0)
+                found = np.flatnonzero(self.nan_rows(x, first, last) == nan)
+
+                if found.size:
+                    return first + int(found[-1])
+
+        return None
+
+    def copy_rows(self, x, out, start=0, stop=None, nans=None):
+        # stream x[start:stop] but the nans rows into out in chunks of rows
+
+        stop = x.shape[0] if stop is None else stop
+
+        keep = None
+        if nans is not None:
+            keep = np.ones(x.shape[0], dtype=bool)
+            keep[np.asarray(nans, dtype=np.int64)] = False
+
+        kept = 0
+        for first in range(start, stop, CHUNK_ROWS):
+            last = min(first + CHUNK_ROWS, stop)
+
+            rows = np.asarray(x[first:last])
+            if keep is not None:
+                rows = rows[keep[first:last]]
+
+            out[kept: kept + rows.shape[0]] = rows
+            kept += rows.shape[0]
+
+        return kept
+
     def get_nans_acc(self, x, check_whole=False):
 
         nans = []
@@ -101,61 +464,82 @@ class buildData:
             for position in ['Bag']:
                 curr = x[position]
 
-                stop = False
-                for i, el in enumerate(curr):
-                    if np.isnan(el).any():
-                        stop = True
-                        nans.append(i)
-
-                    elif stop:
-                        break
+                first = self.find_row(curr, 0, nan=True)
+                if first is not None:
+                    last = self.find_row(curr, first)
+                    last = curr.shape[0] if last is None else last
+                    nans.extend(range(first, last))
 
         else:
             next_start = 0
             for position in self.data.pos:
                 curr = x[position]
 
-                for i, el in enumerate(curr[next_start:]):
+                index = self.find_row(curr, next_start)
+                nans.extend(range(next_start, curr.shape[0] if index is None else index))
 
-                    index = i + next_start
-                    if np.isnan(el).any():
-                        nans.append(index)
-
-                    else:
-                        next_start = index
-                        break
+                if index is not None:
+                    next_start = index
 
             next_start = -1
             for position in self.data.pos:
                 curr = x[position]
+                n = curr.shape[0]
 
-                for i, el in enumerate(curr[next_start::-1]):
-                    index = -i + next_start
-                    if np.isnan(el).any():
-                        nans.append(index)
+                index = self.find_row(curr, n + next_start, backwards=True)
+                nans.extend(range(next_start, -n - 1 if index is None else index - n, -1))
 
-                    else:
-                        next_start = index
-                        break
+                if index is not None:
+                    next_start = index - n
 
         return np.array(nans, dtype=np.int64)
 
     def get_nans(self, x):
-        nans = []
+        n = x.shape[0]
 
-        for i, el in enumerate(x):
-            if np.isnan(el).any():
-                nans.append(i)
+        return np.concatenate([np.flatnonzero(self.nan_rows(x, start, min(start + CHUNK_ROWS, n))) + start
+                               for start in range(0, n, CHUNK_ROWS)] + [np.zeros(0, dtype=np.int64)])
 
-        return nans
+    def tmp_file(self, path, user, day, name):
+        return os.path.join(
+            path,
+            'user' + user + '_' + day + '_' + name + '.mmap'
+        )
 
-    def loc_drop(self, path, exists):
+    def loc_drop_day(self, path, user, day):
 
-        if exists:
-            mode = 'r+'
+        files = []
+        for position in self.data.pos:
+            tmp_dst_loc = self.tmp_file(path, user, day, position + '_location')
+            files.append(tmp_dst_loc)
 
-        else:
-            mode = 'w+'
+            if self.file_done(tmp_dst_loc, 'drop', user, day):
+                continue
+
+            with self.profile.measure('loc_drop', user, day, position):
+                current_loc = self.location[user][day][position]
+                nans = self.get_nans(current_loc)
+
+                n_after_clean = self.n_loc[user][day][position] - len(nans)
+
+                if self.verbose:
+                    print('NaN GPSs: ' + str(len(nans)))
+                    print(tmp_dst_loc)
+
+                tmp_mmap_loc = self.to_mmap(tmp_dst_loc, False, 'drop',
+                                            shape=(n_after_clean, 5))
+
+                self.copy_rows(current_loc, tmp_mmap_loc, nans=nans)
+                self.commit_mmap(tmp_dst_loc, tmp_mmap_loc, user, day)
+
+        return files
+
+    def loc_drop(self, path):
+
+        jobs = [(user, day) for user, days in self.data.files.items() for day in days
+                if not self.day_exists('loc_drop', user, day)]
+
+        self.run('loc_drop', jobs, path)
 
         location = {}
 
@@ -166,438 +550,380 @@ class buildData:
                 location[user][day] = {}
 
                 for position in self.data.pos:
-                    current_loc = self.location[user][day][position]
-                    nans = self.get_nans(current_loc)
+                    tmp_dst_loc = self.tmp_file(path, user, day, position + '_location')
+                    tmp_mmap_loc = self.to_mmap(tmp_dst_loc, True, 'drop')
 
-                    n_after_clean = self.n_loc[user][day][position] - len(nans)
+                    location[user][day][position] = tmp_mmap_loc
+                    self.n_loc[user][day][position] = tmp_mmap_loc.shape[0]
 
-                    tmp_dst_filename = 'user' + user + '_' + day + \
-                                       '_' + position + '_location' + '.mmap'
+        self.manifest.save()
+        self.location = location
 
-                    tmp_dst_loc = os.path.join(
-                        path,
-                        tmp_dst_filename
-                    )
+    def acc_drop_day(self, path, user, day):
+        # rows where any position has NaN acceleration are dropped, a day of
+        # data.splits is also split in two around its inner gap
 
-                    if self.verbose:
-                        print('NaN GPSs: ' + str(len(nans)))
-                        print(tmp_dst_loc)
+        names = [position + '_motion' for position in self.data.pos] + ['labels']
+        sources = [self.acceleration[user][day][position] for position in self.data.pos] + [self.labels[user][day]]
+        columns = [4] * len(self.data.pos) + [2]
 
-                    tmp_mmap_loc = np.memmap(
-                        tmp_dst_loc,
-                        mode=mode,
-                        dtype=np.float64,
-                        shape=(n_after_clean, 5)
-                    )
+        files = [self.tmp_file(path, user, day, name) for name in names]
 
-                    if not exists:
-                        tmp_mmap_loc[:] = np.delete(current_loc, nans, axis=0)
+        if not all(self.file_done(file, 'drop', user, day) for file in files):
+            nans = self.get_nans_acc(self.acceleration[user][day])
+            n_after_clean = self.n_acc[user][day][self.data.pos[0]] - len(nans)
 
-                    location[user][day][position] = tmp_mmap_loc
-                    self.n_loc[user][day][position] = n_after_clean
-
-        self.location = location
+            if self.verbose:
+                print('Acceleration NaNs: ' + str(nans))
 
-    def acc_drop(self, path, exists):
+            for name, source, channels, file in zip(names, sources, columns, files):
+                if self.file_done(file, 'drop', user, day):
+                    continue
 
-        if exists:
-            mode = 'r+'
+                with self.profile.measure('acc_drop', user, day, name.split('_')[0]):
+                    if self.verbose:
+                        print(file)
 
-        else:
-            mode = 'w+'
+                    tmp_mmap = self.to_mmap(file, False, 'drop', shape=(n_after_clean, channels))
 
+                    self.copy_rows(source, tmp_mmap, nans=nans)
+                    self.commit_mmap(file, tmp_mmap, user, day)
 
-        acceleration = {}
-        labels = {}
-        for user, days in self.data.files.items():
+        if (user, day) not in self.data.splits:
+            return files
 
-            acceleration[user] = {}
-            labels[user] = {}
-
-            for day in days:
+        sources = [self.to_mmap(file, True, 'drop') for file in files]
+        nans = self.get_nans_acc(dict(zip(self.data.pos, sources)), check_whole=True)
 
-                acceleration[user][day] = {}
-                labels[user][day] = {}
+        if self.verbose:
+            print('user' + user + '_' + day + \
+                  ' more acceleration nan values:' + str(len(nans)))
 
-                current_acc = self.acceleration[user][day]
-                current_lbs = self.labels[user][day]
+        # rows before and after the gap
+        ranges = [(0, nans[0]), (nans[-1] + 1, sources[0].shape[0])]
 
-                nans = self.get_nans_acc(current_acc)
+        for sg_day, (start, stop) in zip([day + '_1', day + '_2'], ranges):
+            for name, source, channels in zip(names, sources, columns):
+                file = self.tmp_file(path, user, sg_day, name)
+                files.append(file)
 
-                n_after_clean = self.n_acc[user][day][self.data.pos[0]] - len(nans)
+                if self.file_done(file, 'drop', user, sg_day):
+                    continue
 
-                for position in self.data.pos:
-                    self.n_acc[user][day][position] = n_after_clean
+                tmp_mmap = self.to_mmap(file, False, 'drop', shape=(stop - start, channels))
 
-                    tmp_dst_filename = 'user' + user + '_' + day + \
-                                       '_' + position + '_motion' + '.mmap'
+                self.copy_rows(source, tmp_mmap, start=start, stop=stop)
+                self.commit_mmap(file, tmp_mmap, user, sg_day)
 
-                    tmp_dst_acc = os.path.join(
-                        path,
-                        tmp_dst_filename
-                    )
+        return files
 
-                    if self.verbose:
-                        print('Acceleration NaNs: ' + str(nans))
-                        print(tmp_dst_acc)
+    def acc_drop(self, path):
 
-                    tmp_mmap_acc = np.memmap(
-                        tmp_dst_acc,
-                        mode=mode,
-                        dtype=np.float64,
-                        shape=(n_after_clean, 4)
-                    )
+        jobs = [(user, day) for user, days in self.data.files.items() for day in days
+                if not self.day_exists('acc_drop', user, day)]
 
-                    if not exists:
-                        tmp_mmap_acc[:] = np.delete(current_acc[position],
-                                                    nans, axis=0)
+        self.run('acc_drop', jobs, path)
 
-                    acceleration[user][day][position] = tmp_mmap_acc
+        acceleration = {}
+        labels = {}
 
-                tmp_dst_filename = 'user' + user + '_' + day + '_labels' + '.mmap'
+        self.data.files_loc = copy.deepcopy(self.data.files)
+        for user, days in self.data.files_loc.items():
 
-                tmp_dst_lbs = os.path.join(
-                    path,
-                    tmp_dst_filename
-                )
+            acceleration[user] = {}
+            labels[user] = {}
 
-                if self.verbose:
-                    print(tmp_dst_lbs)
+            for day in days:
+                sg_days = [day]
+                if (user, day) in self.data.splits:
+                    sg_days += [day + '_1', day + '_2']
 
-                tmp_mmap_lbs = np.memmap(
-                    tmp_dst_lbs,
-                    mode=mode,
-                    dtype=np.float64,
-                    shape=(n_after_clean, 2)
-                )
+                    index = self.data.files[user].index(day)
+                    self.data.files[user][index:index + 1] = sg_days[1:]
 
-                if not exists:
-                    tmp_mmap_lbs[:] = np.delete(current_lbs,
-                                                nans, axis=0)
+                for sg_day in sg_days:
+                    acceleration[user][sg_day] = {}
+                    self.n_acc[user][sg_day] = {}
 
-                labels[user][day] = tmp_mmap_lbs
+                    for position in self.data.pos:
+                        tmp_dst_acc = self.tmp_file(path, user, sg_day, position + '_motion')
+                        tmp_mmap_acc = self.to_mmap(tmp_dst_acc, True, 'drop')
 
-        self.data.files_loc = copy.deepcopy(self.data.files)
-        if '3' in self.data.files.keys() and '070717' in self.data.files['3']:
-            user = '3'
-            day = '070717'
+                        acceleration[user][sg_day][position] = tmp_mmap_acc
+                        self.n_acc[user][sg_day][position] = tmp_mmap_acc.shape[0]
 
-            current_acc = acceleration[user][day]
+                    tmp_dst_lbs = self.tmp_file(path, user, sg_day, 'labels')
+                    labels[user][sg_day] = self.to_mmap(tmp_dst_lbs, True, 'drop')
 
-            acceleration[user]['070717_1'] = {}
-            acceleration[user]['070717_2'] = {}
+        self.manifest.save()
+        self.acceleration = acceleration
+        self.labels = labels
 
-            nans = self.get_nans_acc(current_acc, check_whole=True)
+    def get_sampling(self, x, n, period):
+        # fix nearest to each period step after the last sample, the
+        # last one of equal timestamps, or -1 when no fix is within
+        # samplingThreshold of the step, which is then searched again from
+        # the last sample. The nearest fix after every fix is found at once
 
-            if self.verbose:
-                print('user' + user + '_' + day + \
-                      ' more acceleration nan values:' + str(len(nans)))
+        threshold = self.data.args.data_args['samplingThreshold'] * 1000
+        period = period * 1000
 
-            n_after_clean = [nans[0], self.n_acc[user][day][self.data.pos[0]] - nans[-1] - 1]
+        t = np.asarray(x[:n, 0])
 
-            self.n_acc[user]['070717_1'] = {}
-            self.n_acc[user]['070717_2'] = {}
+        def nearest(steps, start):
+            after = np.maximum(np.searchsorted(t, steps, side='right'), start)
+            before = after - 1
+            last = np.minimum(after, n - 1)
 
-            index = self.data.files['3'].index('070717')
-            self.data.files_loc = copy.deepcopy(self.data.files)
-            del self.data.files['3'][index]
-            self.data.files['3'].insert(index, '070717_2')
-            self.data.files['3'].insert(index, '070717_1')
+            to_after = np.where(after < n, t[last] - steps, np.inf)
+            to_before = np.where(before >= start, steps - t[before], np.inf)
 
-            for position in self.data.pos:
+            index = np.where(to_after <= to_before,
+                             np.searchsorted(t, t[last], side='right') - 1,
+                             before)
 
-                for segment, sg_day in enumerate(['070717_1', '070717_2']):
-                    self.n_acc[user][sg_day][position] = n_after_clean[segment]
+            return index, np.minimum(to_after, to_before)
 
-                    tmp_dst_filename = 'user' + user + '_' + sg_day + \
-                                       '_' + position + '_motion' + '.mmap'
+        next_index, next_distance = nearest(t + period, np.arange(1, n + 1))
 
-                    tmp_dst_acc = os.path.join(
-                        path,
-                        tmp_dst_filename
-                    )
+        sampled = [0]
+        sample = 0
 
-                    tmp_mmap_acc = np.memmap(
-                        tmp_dst_acc,
-                        mode=mode,
-                        dtype=np.float64,
-                        shape=(n_after_clean[segment], 4)
-                    )
+        while True:
+            index, distance = next_index[sample], next_distance[sample]
+            nextSample = t[sample] + period
 
-                    if not exists:
-                        if segment == 0:
-                            tmp_mmap_acc[:] = current_acc[position][:nans[0]]
+            while index < n - 2 and distance > threshold:
+                sampled.append(-1)
+                nextSample += period
 
-                        else:
-                            tmp_mmap_acc[:] = current_acc[position][nans[-1] + 1:]
+                index, distance = nearest(nextSample, sample + 1)
 
-                    acceleration[user][sg_day][position] = tmp_mmap_acc
+            if index >= n - 2:
+                if distance <= threshold:
+                    sampled.append(index)
 
-            current_lbs = labels[user][day]
+                return np.array(sampled)
 
-            labels[user]['070717_1'] = {}
-            labels[user]['070717_2'] = {}
+            sampled.append(index)
+            sample = index
 
-            for segment, sg_day in enumerate(['070717_1', '070717_2']):
-                tmp_dst_filename = 'user' + user + '_' + sg_day + \
-                                   '_labels' + '.mmap'
+    def fill_location(self, x, sample_indices):
+        # sampled fixes with a clear flag, the runs of at most
+        # interpolateThreshold missing fixes between two fixes linearly
+        # interpolated and the rest of them set to -1
 
-                tmp_dst_lbs = os.path.join(
-                    path,
-                    tmp_dst_filename
-                )
+        n = sample_indices.shape[0]
+        clear = sample_indices != -1
 
-                tmp_mmap_lbs = np.memmap(
-                    tmp_dst_lbs,
-                    mode=mode,
-                    dtype=np.float64,
-                    shape=(n_after_clean[segment], 2)
-                )
+        output = np.zeros((n, 6)) - 1.
+        output[clear, :5] = x[sample_indices[clear]]
+        output[:, 5] = clear
 
-                if not exists:
-                    if segment == 0:
-                        tmp_mmap_lbs[:] = current_lbs[:nans[0]]
+        if self.data.args.data_args['interpolation']:
+            threshold = self.data.args.data_args['interpolateThreshold']
+            slots = np.arange(n)
 
-                    else:
-                        tmp_mmap_lbs[:] = current_lbs[nans[-1] + 1:]
+            before = np.maximum.accumulate(np.where(clear, slots, -1))
+            after = np.minimum.accumulate(np.where(clear, slots, n)[::-1])[::-1]
 
-                labels[user][sg_day] = tmp_mmap_lbs
+            gaps = ~clear & (before >= 0) & (after < n) & (after - before <= threshold + 1)
+            before, after, slots = before[gaps], after[gaps], slots[gaps]
 
-        self.acceleration = acceleration
-        self.labels = labels
+            slope = (output[after, :5] - output[before, :5]) / (after - before).astype(np.float64)[:, np.newaxis]
+            output[slots, :5] = slope * (slots - before).astype(np.float64)[:, np.newaxis] + output[before, :5]
 
-    def get_sampling(self, x, n):
+        return output
 
-        sampled = []
-        threshold = self.data.args.data_args['samplingThreshold'] * 1000
-        period = self.data.args.data_args['gpsSamplingRate'] * 1000
+    def sampling_location_day(self, path, user, day):
+        # the fixes of a position are read once for every period
 
-        j = 1
-        minDistance = np.inf
-        nextSample = x[0,0] + period
-        sampled.append(0)
+        periods = self.rates['sampling_location']
 
-        while True:
-            distance = np.abs((x[j,0] - nextSample))
+        files = []
+        for position in self.data.pos:
+            outputs = [self.rate_file(path, user, day, position + '_location', period) for period in periods]
+            files += outputs
 
-            if j == n-1:
-                if distance <= minDistance:
-                    if distance <= threshold:
-                        sampled.append(j)
+            todo = [(period, output) for period, output in zip(periods, outputs)
+                    if not self.file_done(output, 'sampling', user, day)]
 
-                else:
-                    if minDistance <= threshold:
-                        sampled.append(j - 1)
+            if not todo:
+                continue
 
-                return np.array(sampled)
+            with self.profile.measure('sampling_location', user, day, position):
+                n = self.n_loc[user][day][position]
+                x = np.asarray(self.location[user][day][position][:n])
 
-            if distance <= minDistance:
-                minDistance = distance
-                j += 1
+                for period, tmp_dst_loc in todo:
+                    if self.verbose:
+                        print(tmp_dst_loc)
 
-            else:
-                if minDistance <= threshold:
-                    sampled.append(j - 1)
-                    nextSample = x[j-1,0] + period
+                    sample_indices = self.get_sampling(x, n, period)
 
-                else:
+                    n_after_sampling = sample_indices.shape[0]
 
-                    sampled.append(-1)
-                    nextSample += period
+                    tmp_mmap_loc = self.to_mmap(tmp_dst_loc, False, 'sampling',
+                                                shape=(n_after_sampling, 6))
 
-                    last = 1
-                    while True:
-                        if sampled[-last] != -1:
-                            j = sampled[-last] + 1
-                            break
+                    tmp_mmap_loc[:] = self.fill_location(x, sample_indices)
 
-                        last += 1
+                    self.commit_mmap(tmp_dst_loc, tmp_mmap_loc, user, day)
 
-                minDistance = np.inf
+        return files
 
-    def sampling_location(self, path, exists):
+    def sampling_location(self, path):
 
-        if exists:
-            mode = 'r+'
+        jobs = [(user, day) for user, days in self.data.files_loc.items() for day in days
+                if not self.day_exists('sampling_location', user, day)]
 
-        else:
-            mode = 'w+'
+        self.run('sampling_location', jobs, path)
 
         location = {}
 
-        interpolate = self.data.args.data_args['interpolation']
-        interpThreshold = self.data.args.data_args['interpolateThreshold']
-
         for user, days in self.data.files_loc.items():
             location[user] = {}
             for day in days:
                 location[user][day] = {}
-                for position in self.data.pos:
-
-                    nulls = 0
-                    clear = 0
-                    inter = 0
 
-                    sample_indices = self.get_sampling(
-                        x = self.location[user][day][position],
-                        n = self.n_loc[user][day][position]
-                    )
-
-                    n_after_sampling = sample_indices.shape[0]
-
-                    tmp_dst_filename = 'user' + user + '_' + day + \
-                                       '_' + position + '_location' + '.mmap'
-
-                    tmp_dst_loc = os.path.join(
-                        path,
-                        tmp_dst_filename
-                    )
+                for position in self.data.pos:
+                    tmp_dst_loc = self.rate_file(path, user, day, position + '_location',
+                                                 self.data.args.data_args['gpsSamplingRate'])
+                    tmp_mmap_loc = self.to_mmap(tmp_dst_loc, True, 'sampling')
 
-                    if self.verbose:
-                        print(tmp_dst_loc)
+                    location[user][day][position] = tmp_mmap_loc
+                    self.n_loc[user][day][position] = tmp_mmap_loc.shape[0]
 
-                    tmp_mmap_loc = np.memmap(
-                        tmp_dst_loc,
-                        mode=mode,
-                        dtype=np.float64,
-                        shape=(n_after_sampling, 6)
-                    )
+        self.manifest.save()
+        self.location = location
 
-                    if not exists:
+    def decimate(self, x, outs, qs):
+        # sn.decimate(x[:, 1:4], q, ftype='fir') and the timestamps of
+        # x[::q] of every q of qs, streamed in blocks of input rows that are
+        # read once for all of them: the same zero phase polyphase filter
+        # on the input rows that its taps reach from each block
 
-                        for j, index in enumerate(sample_indices):
-                            if index == -1:
-                                nulls += 1
+        n = x.shape[0]
 
-                                interpolated = False
-                                if interpolate:
+        filters = []
+        for q in qs:
+            half_len = 10 * q
+            n_pre_pad = q - half_len % q
+            n_pre_remove = (half_len + n_pre_pad) // q
 
-                                    point1 = -1
-                                    point2 = -1
+            h = np.concatenate((np.zeros(n_pre_pad), sn.firwin(2 * half_len + 1, 1. / q, window='hamming')))
+            reach = -(-(h.size - 1) // q)
 
-                                    for up in range(1, interpThreshold + 1):
-                                        if j + up >= n_after_sampling:
-                                            break
+            filters.append((h, n_pre_remove, reach))
 
-                                        if -1 != sample_indices[j+up]:
-                                            point2 = j + up
-                                            break
+        lcm = int(np.lcm.reduce(qs))
+        block = max(1, CHUNK_ROWS // lcm) * lcm
 
-                                    if point2 != -1:
-                                        for below in range(1, interpThreshold - up + 2):
-                                            if j - below < 0:
-                                                break
+        for first_row in range(0, n, block):
+            spans = []
+            for q, (h, n_pre_remove, reach) in zip(qs, filters):
+                first = first_row // q
+                last = min(-(-n // q), (first_row + block) // q)
 
-                                            if -1 != sample_indices[j-below]:
-                                                point1 = j - below
-                                                break
+                start = max(0, first + n_pre_remove - reach) * q
+                stop = min(n, (last + n_pre_remove - 1) * q + 1)
 
-                                    if not -1 in [point1, point2]:
-                                        inter += 1
-                                        tmp_mmap_loc[j][:5] = [
-                                            interp1d(
-                                                [point1, point2],
-                                                self.location[user][day][position][sample_indices[[point1,point2]]][:, k])
-                                            ([j]) for k in range(5)]
-                                        interpolated = True
+                spans.append((first, last, start, stop))
 
-                                if not interpolated:
-                                    tmp_mmap_loc[j][:5] = np.zeros(5) - 1.
+            low = min(span[2] for span in spans)
+            rows = np.asarray(x[low:max(span[3] for span in spans)])
 
-                                tmp_mmap_loc[j][5] = 0
+            for out, q, (h, n_pre_remove, _), (first, last, start, stop) in zip(outs, qs, filters, spans):
+                y = sn.upfirdn(h, rows[start - low: stop - low, 1:4], 1, q, axis=0)
 
-                            else:
-                                clear += 1
-                                tmp_mmap_loc[j][:5] = self.location[user][day][position][index]
-                                tmp_mmap_loc[j][5] = 1
+                offset = first + n_pre_remove - start // q
+                out[first:last, 1:4] = y[offset: offset + last - first]
+                out[first:last, 0] = rows[first * q - low: last * q - low: q, 0]
 
-                    location[user][day][position] = tmp_mmap_loc
-                    self.n_loc[user][day][position] = n_after_sampling
+    def subsample(self, x, outs, qs, n):
+        # x[:n:q] of every q of qs, read once in blocks of rows
 
-        self.location = location
+        lcm = int(np.lcm.reduce(qs))
+        block = max(1, CHUNK_ROWS // lcm) * lcm
 
-    def sampling_acceleration_and_labels(self, path, exists):
+        for first_row in range(0, n, block):
+            rows = np.asarray(x[first_row:min(n, first_row + block)])
 
-        if exists:
-            mode = 'r+'
+            for out, q in zip(outs, qs):
+                out[first_row // q: first_row // q + -(-rows.shape[0] // q)] = rows[::q]
 
-        else:
-            mode = 'w+'
+    def sampling_acceleration_day(self, path, user, day):
+        # the labels and the acceleration of each position are read once
+        # for every rate
 
         initial_period = 0.01  # seconds
-        sampling_period = self.data.args.data_args['accSamplingRate']
-        step = int(sampling_period / initial_period)
+        rates = self.rates['sampling_acceleration']
+        steps = [int(rate / initial_period) for rate in rates]
 
-        acceleration = {}
-        labels = {}
-        for user, days in self.data.files.items():
-            acceleration[user] = {}
-            labels[user] = {}
-            for day in days:
-                n_after_sampling = math.ceil(self.n_acc[user][day][self.data.pos[0]] / step)
+        n = self.n_acc[user][day][self.data.pos[0]]
 
-                acceleration[user][day] = {}
-                labels[user][day] = {}
+        names = ['labels'] + [position + '_motion' for position in self.data.pos]
+        sources = [self.labels[user][day]] + [self.acceleration[user][day][position] for position in self.data.pos]
+        columns = [2] + [4] * len(self.data.pos)
 
-                tmp_dst_filename = 'user' + user + '_' + day + '_labels' + '.mmap'
+        files = []
+        for name, source, channels in zip(names, sources, columns):
+            outputs = [self.rate_file(path, user, day, name, rate) for rate in rates]
+            files += outputs
 
-                tmp_dst_lbs = os.path.join(
-                    path,
-                    tmp_dst_filename
-                )
+            todo = [(step, output) for step, output in zip(steps, outputs)
+                    if not self.file_done(output, 'sampling', user, day)]
 
+            if not todo:
+                continue
+
+            with self.profile.measure('sampling_acceleration', user, day, name.split('_')[0]):
                 if self.verbose:
-                    print(tmp_dst_lbs)
+                    for _, output in todo:
+                        print(output)
 
-                tmp_mmap_lbs = np.memmap(
-                    tmp_dst_lbs,
-                    mode=mode,
-                    dtype=np.float64,
-                    shape=(n_after_sampling, 2)
-                )
+                mmaps = [self.to_mmap(output, False, 'sampling', shape=(math.ceil(n / step), channels))
+                         for step, output in todo]
 
-                if not exists:
+                if name == 'labels':
+                    self.subsample(source, mmaps, [step for step, _ in todo], n)
 
-                    for i, j in enumerate(range(0, self.n_acc[user][day][self.data.pos[0]], step)):
-                        tmp_mmap_lbs[i] = self.labels[user][day][j]
+                else:
+                    self.decimate(source, mmaps, [step for step, _ in todo])
 
-                labels[user][day] = tmp_mmap_lbs
+                for (_, output), mmap in zip(todo, mmaps):
+                    self.commit_mmap(output, mmap, user, day)
 
-                for position in self.data.pos:
+        return files
 
-                    tmp_dst_filename = 'user' + user + '_' + day + \
-                                       '_' + position + '_motion' + '.mmap'
+    def sampling_acceleration_and_labels(self, path):
 
-                    tmp_dst_acc = os.path.join(
-                        path,
-                        tmp_dst_filename
-                    )
+        rate = self.data.args.data_args['accSamplingRate']
 
-                    if self.verbose:
-                        print(tmp_dst_acc)
+        jobs = [(user, day) for user, days in self.data.files.items() for day in days
+                if not self.day_exists('sampling_acceleration', user, day)]
 
-                    tmp_mmap_acc = np.memmap(
-                        tmp_dst_acc,
-                        mode=mode,
-                        dtype=np.float64,
-                        shape=(n_after_sampling, 4)
-                    )
+        self.run('sampling_acceleration', jobs, path)
 
-                    if not exists:
+        acceleration = {}
+        labels = {}
+        for user, days in self.data.files.items():
+            acceleration[user] = {}
+            labels[user] = {}
+            for day in days:
+                acceleration[user][day] = {}
 
-                        for i, j in enumerate(range(0, self.n_acc[user][day][position], step)):
-                            tmp_mmap_acc[i, 0] = self.acceleration[user][day][position][j, 0]
+                tmp_dst_lbs = self.rate_file(path, user, day, 'labels', rate)
+                labels[user][day] = self.to_mmap(tmp_dst_lbs, True, 'sampling')
 
-                        tmp_mmap_acc[:, 1:4] = sn.decimate(
-                            x=self.acceleration[user][day][position][:, 1:4],
-                            q=step,
-                            ftype='fir',
-                            axis=0
-                        )
+                for position in self.data.pos:
+                    tmp_dst_acc = self.rate_file(path, user, day, position + '_motion', rate)
+                    tmp_mmap_acc = self.to_mmap(tmp_dst_acc, True, 'sampling')
 
                     acceleration[user][day][position] = tmp_mmap_acc
-                    self.n_acc[user][day][position] = n_after_sampling
+                    self.n_acc[user][day][position] = tmp_mmap_acc.shape[0]
 
+        self.manifest.save()
         self.acceleration = acceleration
         self.labels = labels
 
@@ -605,39 +931,34 @@ class buildData:
 
         path = os.path.join(
             path,
-            'drop'
+            'drop',
+            self.fingerprints['drop']
         )
 
         if not os.path.exists(path):
             os.makedirs(path)
 
-            self.loc_drop(path, exists=False)
-            self.acc_drop(path, exists=False)
-
-            return
-
-        self.loc_drop(path, exists=True)
-        self.acc_drop(path, exists=True)
+        with self.profile.measure('loc_drop'):
+            self.loc_drop(path)
+        with self.profile.measure('acc_drop'):
+            self.acc_drop(path)
 
     def sampling(self, path):
 
         path = os.path.join(
             path,
-            'sampling'
+            'sampling',
+            self.fingerprints['sampling']
         )
 
         if not os.path.exists(path):
             os.makedirs(path)
 
-            self.sampling_location(path, exists=False)
-
-            self.sampling_acceleration_and_labels(path, exists=False)
-
-            return
+        with self.profile.measure('sampling_location'):
+            self.sampling_location(path)
 
-        self.sampling_location(path, exists=True)
-
-        self.sampling_acceleration_and_labels(path, exists=True)
+        with self.profile.measure('sampling_acceleration'):
+            self.sampling_acceleration_and_labels(path)
 
     def modify(self):
 
@@ -673,6 +994,28 @@ class buildData:
             print('')
             print('------------------------')
 
+    def window_mmap(self, path, signal, stored, segments, duration, stride, stage):
+        # window table of a signal holding the days of stored, a window of
+        # duration rows every stride rows of each day. The windows follow
+        # the order of segments, not the order the days were appended to
+        # the signal in, so that they do not depend on the build history.
+        # The table is small and is written again on every build. Returns
+        # the windows and their segments
+
+        offsets = dict(zip([segment[0] for segment in stored],
+                           np.cumsum([0] + [segment[3] for segment in stored])))
+
+        windows = [segment[:3] + [max(0, math.ceil((segment[3] - duration + 1) / stride))]
+                   for segment in segments]
+
+        starts = np.concatenate([offsets[window[0]] + stride * np.arange(window[3], dtype=np.int64)
+                                 for window in windows] + [np.zeros(0, dtype=np.int64)])
+
+        mmap = create_windows(path, starts, signal, duration, stage=stage, fingerprint=self.fingerprints[stage])
+        self.manifest.set_segments(path, windows)
+
+        return mmap, windows
+
     def get_acc_shape(self):
 
         duration = self.data.args.data_args['accDuration']
@@ -682,12 +1025,15 @@ class buildData:
         duration = duration + (bagSize - 1) * (bagStride)
         stride = self.data.args.data_args['accStride']
 
+        # Acc_x, Acc_y, Acc_z and, with derivedSignals, Acc_norm and Jerk
+        position_channels = 5 if self.data.args.data_args['derivedSignals'] else 3
+
         words = 0
         for user, days in self.data.files.items():
             for day in days:
                 channels = 0
                 for position in self.data.pos:
-                    channels += 3
+                    channels += position_channels
                     n = self.n_acc[user][day][position]
 
                 extra_words = math.ceil((n - duration + 1) / stride)
@@ -715,13 +1061,62 @@ class buildData:
 
         return words, duration, channels + 3  # + 3 for user,day,time
 
-    def loc_wordify(self, path, exists):
+    # rows of a day written at their precomputed offset of the signal
 
-        if exists:
-            mode = 'r+'
+    def loc_signal_day(self, signal, position, user, day, d, offset, n):
+        with self.profile.measure('loc_signal', user, day, position):
+            current_loc = self.location[user][day][position]
+            channel = 0
 
-        else:
-            mode = 'w+'
+            for direction in self.data.loc.keys():
+                signal[offset:offset + n, channel] = current_loc[:n, direction]
+                channel += 1
+
+            signal[offset:offset + n, 4] = current_loc[:n, 5]
+            signal[offset:offset + n, -3] = int(user)
+            signal[offset:offset + n, -2] = d
+            signal[offset:offset + n, -1] = current_loc[:n, 0]
+
+    def acc_signal_day(self, signal, user, day, d, offset, n):
+        channel = 0
+
+        for position in self.data.pos:
+
+            current_acc = self.acceleration[user][day][position]
+
+            for direction in self.data.acc.keys():
+                signal[offset:offset + n, channel] = current_acc[:n, direction]
+                channel += 1
+
+        if self.data.args.data_args['derivedSignals']:
+            # Acc_norm and Jerk of every position after the axes, computed
+            # as temporalTransformer does, the Jerk of the last row of a day is 0
+            freq = int(1. / self.data.args.data_args['accSamplingRate'])
+            positions = len(self.data.pos)
+
+            for i, position in enumerate(self.data.pos):
+                xyz = np.stack([np.asarray(self.acceleration[user][day][position][:n, direction])
+                                for direction in self.data.acc.keys()], axis=1)
+
+                jerk = np.zeros(n)
+                jerk[:-1] = np.sqrt(np.sum(((xyz[1:] - xyz[:-1]) * freq) ** 2, axis=1))
+
+                signal[offset:offset + n, 3 * positions + i] = np.sqrt(np.sum(xyz ** 2, axis=1))
+                signal[offset:offset + n, 4 * positions + i] = jerk
+
+        signal[offset:offset + n, -3] = int(user)
+        signal[offset:offset + n, -2] = d
+        signal[offset:offset + n, -1] = current_acc[:n, 0]
+
+    def lbs_signal_day(self, signal, user, day, d, offset, n):
+        current_lbs = self.labels[user][day]
+
+        signal[offset:offset + n, 0] = current_lbs[:n, 1]
+        signal[offset:offset + n, -3] = int(user)
+        signal[offset:offset + n, -2] = d
+        signal[offset:offset + n, -1] = current_lbs[:n, 0]
+
+    def loc_wordify(self, path):
 
         samples, duration, channels = self.get_loc_shape()
 
@@ -731,88 +1126,63 @@ class buildData:
             'channels': channels
         }
 
-        final_mmaps = []
+        stride = self.data.args.data_args['locStride']
+
+        order = {}
+        for segment in self.acc_segments:
+            order.setdefault(segment[0].split('_')[0], len(order))
 
-        for pos_samples, pos_channel, position in zip(samples, channels, self.data.pos):
-            final_filename = 'location' + '_' + position + '.mmap'
+        final_mmaps = []
+        self.loc_segments = []
 
+        for pos_channel, position in zip(channels, self.data.pos):
             final_loc = os.path.join(
                 path,
-                final_filename
+                'location' + '_' + position + '.mmap'
             )
 
-            if self.verbose:
-                print(final_loc)
-
-            final_mmap_loc = np.memmap(
-                final_loc,
-                mode=mode,
-                dtype=np.float64,
-                shape=(
-                    pos_samples,
-                    duration,
-                    pos_channel
-                )
+            final_signal = os.path.join(
+                path,
+                'location' + '_' + position + '_signal' + '.mmap'
             )
 
-            if not exists:
-                stride = self.data.args.data_args['locStride']
-                offset = 0
-
-                for user, days in self.data.files_loc.items():
-                    for d, day in enumerate(days):
-                        channel = 0
+            if self.verbose:
+                print(final_loc)
 
-                        current_loc = self.location[user][day][position]
-                        n = self.n_loc[user][day][position]
-                        words = math.ceil((n - duration + 1) / stride)
-                        words = max(0, words)
+            days = {}
+            segments = []
+            for user, user_days in self.data.files_loc.items():
+                for d, day in enumerate(user_days):
+                    n = self.n_loc[user][day][position]
 
-                        for direction in self.data.loc.keys():
+                    segment = self.manifest.segment(user, day, d, n)
+                    days[segment[0]] = (user, day, d)
+                    segments.append(segment)
 
-                            current_dir = copy.deepcopy(current_loc[:, direction])
-                            word_loc = np.lib.stride_tricks.as_strided(
-                                current_dir,
-                                shape=(words, duration),
-                                strides=(stride * 8, 8)
-                            )
+            # the windows follow the order of the acceleration windows
+            segments.sort(key=lambda segment: order[segment[0]])
 
-                            final_mmap_loc[offset:offset + words, :, channel] = word_loc
-                            channel += 1
+            signal_mmap_loc, loc_signal, plan = self.append_mmap(final_signal, 'finalData', segments,
+                                                                 shape=(pos_channel,))
 
-                        current_dir = copy.deepcopy(current_loc[:, 5])
-                        word_loc = np.lib.stride_tricks.as_strided(
-                            current_dir,
-                            shape=(words, duration),
-                            strides=(stride * 8, 8)
-                        )
+            if plan is not None:
 
-                        final_mmap_loc[offset:offset + words, :, 4] = word_loc
+                self.run('loc_signal', [days[segment[0]] + (offset, segment[3]) for offset, segment in plan],
+                         signal_mmap_loc, position)
 
+                self.seal_segments(final_signal, signal_mmap_loc, loc_signal, plan)
 
-                        time = copy.deepcopy(current_loc[:, 0])
-                        word_time = np.lib.stride_tricks.as_strided(
-                            time,
-                            shape=(words, duration),
-                            strides=(stride * 8, 8)
-                        )
+            del signal_mmap_loc
 
-                        final_mmap_loc[offset:offset + words, :, -3] = int(user)
-                        final_mmap_loc[offset:offset + words, :, -2] = d
-                        final_mmap_loc[offset:offset + words, :, -1] = word_time
-                        offset += words
+            final_mmap_loc, segments = self.window_mmap(final_loc, final_signal, loc_signal, segments,
+                                                        duration, stride, 'finalData')
 
             final_mmaps.append(final_mmap_loc)
+            self.loc_segments.append(segments)
 
         return final_mmaps
 
-    def acc_lbs_wordify(self, path, exists):
-
-        if exists:
-            mode = 'r+'
-
-        else:
-            mode = 'w+'
+    def acc_lbs_wordify(self, path):
 
         samples, duration, channels = self.get_acc_shape()
 
@@ -828,136 +1198,80 @@ class buildData:
             'channels': 4
         }
 
-        final_filename = 'acceleration' + '.mmap'
+        stride = self.data.args.data_args['accStride']
+
+        days = {}
+        segments = []
+        for user, user_days in self.data.files.items():
+            for d, day in enumerate(user_days):
+                n = self.n_acc[user][day][self.data.pos[-1]]
+
+                segment = self.manifest.segment(user, day, d, n)
+                days[segment[0]] = (user, day, d)
+                segments.append(segment)
 
         final_acc = os.path.join(
             path,
-            final_filename
+            'acceleration' + '.mmap'
         )
 
-        if self.verbose:
-            print(final_acc)
-
-        final_mmap_acc = np.memmap(
-            final_acc,
-            mode=mode,
-            dtype=np.float64,
-            shape=(
-                samples,
-                duration,
-                channels
-            )
+        final_signal = os.path.join(
+            path,
+            'acceleration_signal' + '.mmap'
         )
 
-        if not exists:
-
-            stride = self.data.args.data_args['accStride']
-            offset = 0
-
-            for user, days in self.data.files.items():
-
-                for d, day in enumerate(days):
-
-                    channel = 0
-
-                    for position in self.data.pos:
-
-                        current_acc = self.acceleration[user][day][position]
-                        n = self.n_acc[user][day][position]
-
-                        for direction in self.data.acc.keys():
-
-                            words = math.ceil((n - duration + 1) / stride)
-                            words = max(0, words)
+        if self.verbose:
+            print(final_acc)
 
-                            current_dir = copy.deepcopy(current_acc[:, direction])
+        header = read_header(final_signal)
+        previous = header['attrs'].get('coding') if header else None
 
-                            word_acc = np.lib.stride_tricks.as_strided(
-                                current_dir,
-                                shape=(words, duration),
-                                strides=(stride * 8, 8)
-                            )
+        signal_mmap_acc, acc_signal, plan = self.append_mmap(final_signal, 'finalData', segments,
+                                                             shape=(channels,),
+                                                             coding=self.acc_coding(channels, previous))
 
-                            if words > 0:
-                                final_mmap_acc[offset:offset + words, :, channel] = word_acc
-                            channel += 1
+        if plan is not None:
 
-                    time = copy.deepcopy(current_acc[:, 0])
+            self.run('acc_signal', [days[segment[0]] + (offset, segment[3]) for offset, segment in plan],
+                     signal_mmap_acc)
 
-                    word_time = np.lib.stride_tricks.as_strided(
-                        time,
-                        shape=(words, duration),
-                        strides=(stride * 8, 8)
-                    )
+            self.seal_segments(final_signal, signal_mmap_acc, acc_signal, plan)
 
-                    if words > 0:
-                        final_mmap_acc[offset:offset + words, :, -3] = int(user)
-                        final_mmap_acc[offset:offset + words, :, -2] = d
-                        final_mmap_acc[offset:offset + words, :, -1] = word_time
-                    offset += words
+        del signal_mmap_acc
 
-        final_filename = 'labels' + '.mmap'
+        final_mmap_acc, self.acc_segments = self.window_mmap(final_acc, final_signal, acc_signal, segments,
+                                                             duration, stride, 'finalData')
 
         final_lbs = os.path.join(
             path,
-            final_filename
+            'labels' + '.mmap'
         )
 
-        if self.verbose:
-            print(final_lbs)
-
-        final_mmap_lbs = np.memmap(
-            final_lbs,
-            mode=mode,
-            dtype=np.int64,
-            shape=(
-                samples,
-                duration,
-                4
-            )
+        final_signal = os.path.join(
+            path,
+            'labels_signal' + '.mmap'
         )
 
-        if not exists:
-
-            stride = self.data.args.data_args['accStride']
-            offset = 0
-            for user, days in self.data.files.items():
-
-                for d, day in enumerate(days):
-
-                    current_lbs = self.labels[user][day]
-
-                    for position in self.data.pos:
-                        n = self.n_acc[user][day][position]
-
-                    words = math.ceil((n - duration + 1) / stride)
-                    words = max(0, words)
-
-                    lbs = copy.deepcopy(current_lbs[:, 1])
+        if self.verbose:
+            print(final_lbs)
 
-                    word_lbs = np.lib.stride_tricks.as_strided(
-                        lbs,
-                        shape=(words, duration),
-                        strides=(stride * 8, 8)
-                    )
+        signal_mmap_lbs, lbs_signal, plan = self.append_mmap(final_signal, 'finalData', acc_signal,
+                                                             shape=(4,),
+                                                             dtype=np.int64,
+                                                             coding=self.lbs_coding(),
+                                                             ordered=True)
 
-                    if words > 0:
-                        final_mmap_lbs[offset:offset + words, :, 0] = word_lbs
+        if plan is not None:
 
-                    time = copy.deepcopy(current_lbs[:, 0])
+            self.run('lbs_signal', [days[segment[0]] + (offset, segment[3]) for offset, segment in plan],
+                     signal_mmap_lbs)
 
-                    word_time = np.lib.stride_tricks.as_strided(
-                        time,
-                        shape=(words, duration),
-                        strides=(stride * 8, 8)
-                    )
+            self.seal_segments(final_signal, signal_mmap_lbs, lbs_signal, plan)
 
-                    if words > 0:
-                        final_mmap_lbs[offset:offset + words, :, -3] = int(user)
-                        final_mmap_lbs[offset:offset + words, :, -2] = d
-                        final_mmap_lbs[offset:offset + words, :, -1] = word_time
+        del signal_mmap_lbs
 
-                    offset += words
+        final_mmap_lbs, _ = self.window_mmap(final_lbs, final_signal, lbs_signal, segments,
+                                             duration, stride, 'finalData')
 
         return final_mmap_acc, final_mmap_lbs
 
@@ -992,22 +1306,83 @@ class buildData:
         with open(config_path, 'w') as yaml_file:
             yaml.dump(shapes, yaml_file, default_flow_style=False)
 
+    def save_index(self):
+        # rows of every user/day in each final and filtered array and the
+        # samples of every user/day/position they were windowed from
+
+        samples = {}
+        for user, days in self.data.files.items():
+            for day in days:
+                for position in self.data.pos:
+                    samples.setdefault(user + '/' + day, {}).setdefault(position, {})['acceleration'] = \
+                        int(self.n_acc[user][day][position])
+
+        for user, days in self.data.files_loc.items():
+            for day in days:
+                for position in self.data.pos:
+                    samples.setdefault(user + '/' + day, {}).setdefault(position, {})['location'] = \
+                        int(self.n_loc[user][day][position])
+
+        def entries(segments, counts):
+            start = 0
+            output = []
+            for segment, count in zip(segments, counts):
+                output.append([segment[0], segment[0].split('/')[0], segment[2], start, start + int(count)])
+                start += int(count)
+
+            return output
+
+        acc_rows = [segment[3] for segment in self.acc_segments]
+        bounds = np.cumsum([0] + acc_rows)
+
+        filtered_rows = np.diff(np.searchsorted(self.kept_windows, bounds))
+
+        rows = {
+            'finalData/acceleration.mmap': entries(self.acc_segments, acc_rows),
+            'finalData/labels.mmap': entries(self.acc_segments, acc_rows),
+            'filteredData/acceleration.mmap': entries(self.acc_segments, filtered_rows),
+            'filteredData/labels.mmap': entries(self.acc_segments, filtered_rows)
+        }
+
+        for position, pos_name in enumerate(self.data.pos):
+            segments = self.loc_segments[position]
+            loc_rows = [segment[3] for segment in segments]
+            bounds = np.cumsum([0] + loc_rows)
+
+            kept = self.location[position][:, self.loc_pivot, 0] != -1
+            kept = [np.count_nonzero(kept[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+            rows['finalData/location_' + pos_name + '.mmap'] = entries(segments, loc_rows)
+            rows['filteredData/location_' + pos_name + '.mmap'] = entries(segments, kept)
+
+        self.data.catalog.save_index(samples, rows)
+
+    def seal_stage(self, path):
+        # the arrays of a finalData or filteredData folder are complete
+        seal_folder(path, [os.path.join(path, name + '.mmap')
+                           for name in ['acceleration', 'labels'] +
+                           ['location_' + position for position in self.data.pos]])
+
     def wordify(self):
 
         path = os.path.join(
             self.path,
-            'finalData'
+            'finalData',
+            self.fingerprints['finalData']
         )
 
         if not os.path.exists(path):
             os.makedirs(path)
-            exists = False
 
-        else:
-            exists = True
+        unseal_folder(path)
 
-        self.location = self.loc_wordify(path, exists)
-        self.acceleration, self.labels = self.acc_lbs_wordify(path, exists)
+        with self.profile.measure('acc_lbs_wordify'):
+            self.acceleration, self.labels = self.acc_lbs_wordify(path)
+
+        with self.profile.measure('loc_wordify'):
+            self.location = self.loc_wordify(path)
+
+        self.seal_stage(path)
 
         if self.verbose:
             print('PREPARING DATA FOR FEEDING TO THE MODEL')
@@ -1027,12 +1402,151 @@ class buildData:
             print("")
             print(self.labels_shape)
 
-    def loc_filter(self, path, exists):
+    def tape_day(self, tape, signal, nperseg, noverlap, user, day, start, rows, offset, n):
+        # spectra of every hop rows of a day for each spectoTape signal and
+        # position, the signals computed as temporalTransformer does
+        if not n:
+            return
 
-        if exists:
-            mode = 'r+'
-        else:
-            mode = 'w+'
+        freq = int(1. / self.data.args.data_args['accSamplingRate'])
+        derived = self.data.args.data_args['derivedSignals']
+        positions = len(self.data.pos)
+        acc = np.asarray(signal[start:start + rows])
+
+        for i in range(positions):
+            xyz = np.array(acc[:, 3 * i: 3 * i + 3])
+
+            for s, name in enumerate(self.data.args.data_args['spectoTape']):
+                if name in ['Acc_x', 'Acc_y', 'Acc_z']:
+                    x = xyz[:, ['Acc_x', 'Acc_y', 'Acc_z'].index(name)]
+
+                elif name == 'Acc_norm':
+                    x = acc[:, 3 * positions + i] if derived else np.sqrt(np.sum(xyz ** 2, axis=1))
+
+                elif name == 'Jerk':
+                    if derived:
+                        x = acc[:, 4 * positions + i]
+
+                    else:
+                        x = np.zeros(rows)
+                        x[:-1] = np.sqrt(np.sum(((xyz[1:] - xyz[:-1]) * freq) ** 2, axis=1))
+
+                else:
+                    raise ValueError('unknown spectoTape signal: ' + name)
+
+                _, _, spectra = sn.spectrogram(x, fs=freq, nperseg=nperseg, noverlap=noverlap)
+                tape[offset:offset + n, s, i] = spectra.T
+
+    def spectro_tape(self):
+        # spectrograms of the spectoTape signals along every day of the final
+        # acceleration signal, a spectrum every hop rows. The spectrogram of
+        # an instance starting a multiple of hop rows into its day is a slice
+        # of the tape, tape_rows holds the first signal and tape row of
+        # every day
+
+        names = self.data.args.data_args['spectoTape']
+        if not names:
+            return
+
+        path = os.path.join(
+            self.path,
+            'spectoTape',
+            self.fingerprints['spectoTape']
+        )
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        unseal_folder(path)
+
+        freq = int(1. / self.data.args.data_args['accSamplingRate'])
+        nperseg = int(self.data.args.data_args['spectoWindow'] * freq)
+        noverlap = int(self.data.args.data_args['spectoOverlap'] * freq)
+        hop = nperseg - noverlap
+
+        final_signal = os.path.join(
+            self.path,
+            'finalData',
+            self.fingerprints['finalData'],
+            'acceleration_signal' + '.mmap'
+        )
+
+        signal = open_mmap(final_signal, mode='r', fingerprint=self.fingerprints['finalData'])
+        coding = read_header(final_signal)['attrs'].get('coding')
+
+        tape_file = os.path.join(
+            path,
+            'tape' + '.mmap'
+        )
+
+        if self.verbose:
+            print(tape_file)
+
+        # the spectra of the kept days are stale once the signal is coded again
+        header = read_header(tape_file)
+        if header and header['attrs'].get('signal_coding') != coding:
+            os.remove(tape_file)
+
+        signal_segments = self.manifest.get_segments(final_signal)
+        starts = np.cumsum([0] + [segment[3] for segment in signal_segments])
+
+        days = {}
+        segments = []
+        for start, segment in zip(starts, signal_segments):
+            user, day = segment[0].split('/', 1)
+            days[segment[0]] = (user, day, int(start), segment[3])
+            segments.append(segment[:3] + [max(0, (segment[3] - nperseg) // hop + 1)])
+
+        tape, order, plan = self.append_mmap(tape_file, 'spectoTape', segments,
+                                             shape=(len(names), len(self.data.pos), nperseg // 2 + 1),
+                                             ordered=True)
+
+        if plan is not None:
+
+            self.run('tape', [days[segment[0]] + (offset, segment[3]) for offset, segment in plan],
+                     tape, signal, nperseg, noverlap)
+
+            self.seal_segments(tape_file, tape, order, plan, attrs={'signal_coding': coding})
+
+        del tape
+
+        rows_file = os.path.join(
+            path,
+            'tape_rows' + '.mmap'
+        )
+
+        rows = create_mmap(rows_file, (len(order), 2), np.int64, stage='spectoTape',
+                           fingerprint=self.fingerprints['spectoTape'],
+                           attrs={'signals': names, 'nperseg': nperseg, 'noverlap': noverlap})
+
+        if len(order):
+            rows[:, 0] = starts[:-1]
+            rows[:, 1] = np.cumsum([0] + [segment[3] for segment in order])[:-1]
+
+        seal_mmap(rows_file, rows)
+
+        # the tape belongs to the final signal it was computed from
+        seal_folder(path, [tape_file, rows_file, final_signal])
+
+    def repair_windows(self, windows, pivot):
+        # missing fixes of GPS windows set to -1 with the timestamp of the
+        # nearest fix towards the pivot
+
+        missing = windows[:, :, 0] == -1
+        slots = np.arange(windows.shape[1])
+
+        location = windows[:, :, :4]
+        location[missing] = -1.
+
+        after = np.maximum.accumulate(np.where(missing[:, pivot:], -1, slots[pivot:]), axis=1)
+        before = np.minimum.accumulate(np.where(missing[:, pivot::-1], windows.shape[1], slots[pivot::-1]), axis=1)
+        source = np.concatenate((before[:, :0:-1], after), axis=1)
+
+        windows[:, :, -1] = np.take_along_axis(windows[:, :, -1], source, axis=1)
+
+        return windows
+
+    def loc_filter(self, path):
 
         filtered_mmaps_loc = []
 
@@ -1052,17 +1566,12 @@ class buildData:
         elif sync == 'Future':
             pivot = 0
 
+        self.loc_pivot = pivot
+
         for position, pos_name in enumerate(self.data.pos):
 
-            no_gps_signal = []
             pos_location = self.location[position]
 
-            for i, sample in enumerate(pos_location):
-                if np.any(sample[pivot][0] == -1):
-                    no_gps_signal.append(i)
-
-            (samples, duration, features) = tuple(pos_location.shape)
-
             filtered_filename = 'location' + '_' + pos_name + '.mmap'
 
             filtered_loc = os.path.join(
@@ -1073,56 +1582,36 @@ class buildData:
             if self.verbose:
                 print(filtered_loc)
 
-            filtered_mmap_loc = np.memmap(
-                filtered_loc,
-                mode=mode,
-                dtype=np.float64,
-                shape=(
-                    samples - len(no_gps_signal),
-                    duration,
-                    features
-                )
-            )
-
-            self.loc_shape['samples'].append(samples - len(no_gps_signal))
-            self.loc_shape['duration'] = duration
-            self.loc_shape['channels'].append(features)
-
-            if not exists:
-
-                filtered_mmap_loc[:] = np.delete(pos_location, no_gps_signal, 0)
+            # filtered again on every build, in the order of the final windows
+            no_gps_signal = np.count_nonzero(pos_location[:, pivot, 0] == -1)
 
-                for w, loc_window in enumerate(filtered_mmap_loc):
-
-                    length = 0
-                    offset = pivot + 1
-
-                    while length < duration - pivot - 1:
+            (samples, duration, features) = tuple(pos_location.shape)
 
-                        if loc_window[offset][0] == -1:
+            filtered_mmap_loc = create_mmap(filtered_loc, (samples - no_gps_signal, duration, features),
+                                            stage='filteredData', fingerprint=self.fingerprints['filteredData'])
 
-                            filtered_mmap_loc[w][offset][:4] = [-1. for _ in range(4)]
-                            filtered_mmap_loc[w][offset][-1] = filtered_mmap_loc[w][offset-1][-1]
+            self.loc_shape['samples'].append(samples - no_gps_signal)
+            self.loc_shape['duration'] = duration
+            self.loc_shape['channels'].append(features)
 
-                        offset += 1
-                        length += 1
+            chunk = max(1, CHUNK_ROWS // duration)
 
-                    length = 0
-                    offset = pivot - 1
-                    while length < pivot:
+            kept = 0
+            for first in range(0, samples, chunk):
+                windows = np.array(pos_location[first:first + chunk])
+                windows = windows[windows[:, pivot, 0] != -1]
 
-                        if loc_window[offset][0] == -1.:
-                            filtered_mmap_loc[w][offset][:4] = [-1. for _ in range(4)]
-                            filtered_mmap_loc[w][offset][-1] = filtered_mmap_loc[w][offset+1][-1]
+                filtered_mmap_loc[kept:kept + windows.shape[0]] = self.repair_windows(windows, pivot)
+                kept += windows.shape[0]
 
-                        offset -= 1
-                        length += 1
+            seal_mmap(filtered_loc, filtered_mmap_loc)
+            self.manifest.set_segments(filtered_loc, self.loc_segments[position])
 
         filtered_mmaps_loc.append(filtered_mmap_loc)
 
         return filtered_mmaps_loc
 
-    def get_lb_indices(self):
+    def get_lb_indices(self, start=0):
         output_indices = []
 
         bagSize = self.data.args.data_args['accBagSize']
@@ -1142,113 +1631,96 @@ class buildData:
 
         label_position = pivot * bagStride + duration // 2
 
-        for i, sample_lbs in enumerate(self.labels):
-
-            if majorityVoting:
-                labels = sample_lbs[pivot * bagStride : pivot * bagStride + duration, 0]
-
-                classNum = {}
+        if not majorityVoting:
+            labels = np.asarray(self.labels[start:, label_position, 0])
+            windows = np.flatnonzero(labels != 0)
 
-                for label in labels:
+            return np.stack((windows + start,
+                             np.full(windows.shape, label_position),
+                             labels[windows]), axis=1).astype(np.int64)
 
-                    if not label in classNum:
-                        classNum[label] = 1
+        # the first label of a window counted at least threshold times in
+        # the bag pivot, the window is kept if it is not the null label
+        chunk = max(1, CHUNK_ROWS // duration)
 
-                    else:
-                        classNum[label] += 1
-
-                topClass = [k for k, v in classNum.items() if v >= threshold]
+        for first in range(start, self.labels.shape[0], chunk):
+            labels = np.asarray(self.labels[first:first + chunk, pivot * bagStride: pivot * bagStride + duration, 0])
+            windows = np.arange(labels.shape[0])
 
-                if len(topClass) and topClass[0] != 0:
-                    output_indices.append([i, label_position, topClass[0]])
+            classes = labels.max() + 1 if labels.size else 1
+            counts = np.bincount((windows[:, np.newaxis] * classes + labels).ravel(),
+                                 minlength=labels.shape[0] * classes).reshape(-1, classes)
 
-            else:
-                label = sample_lbs[label_position, 0]
-                if label != 0:
-                    output_indices.append([i, label_position, label])
+            top = counts[windows[:, np.newaxis], labels] >= threshold
+            found = top.any(axis=1)
+            label = labels[windows, np.argmax(top, axis=1)]
 
-        return np.array(output_indices)
+            windows = np.flatnonzero(found & (label != 0))
+            output_indices.append(np.stack((windows + first,
+                                            np.full(windows.shape, label_position),
+                                            label[windows]), axis=1))
 
-    def labels_filter(self, path, exists):
+        return np.concatenate(output_indices + [np.zeros((0, 3))]).astype(np.int64)
 
-        if exists:
-            mode = 'r+'
-        else:
-            mode = 'w+'
+    def labels_filter(self, path):
+        # the filtered acceleration windows are only the labelled windows of
+        # the final signal, the filtered labels point at them in order
 
-        keep_indices = self.get_lb_indices()
-
-        filtered_n = keep_indices.shape[0]
-        samples = self.acceleration.shape[0]
         duration = self.acceleration.shape[1]
         features_acc = self.acceleration.shape[2]
         features_lbs = self.labels.shape[2]
 
-        self.acceleration_shape = {
-            'samples': samples,
-            'duration': duration,
-            'channels': features_acc
-        }
-
-        self.labels_shape = {
-            'samples': filtered_n,
-            'channels': features_lbs + 2
-        }
-
-        filtered_filename = 'acceleration' + '.mmap'
-
         filtered_acc = os.path.join(
             path,
-            filtered_filename
+            'acceleration' + '.mmap'
         )
 
-        if self.verbose:
-            print(filtered_acc)
-
-        filtered_mmap_acc = np.memmap(
-            filtered_acc,
-            mode=mode,
-            dtype=np.float64,
-            shape=(
-                samples,
-                duration,
-                features_acc
-            )
-        )
-
-        if not exists:
-            for index in range(samples):
-                filtered_mmap_acc[index] = self.acceleration[index]
-
-
-        filtered_filename = 'labels' + '.mmap'
-
         filtered_lbs = os.path.join(
             path,
-            filtered_filename
+            'labels' + '.mmap'
         )
 
         if self.verbose:
+            print(filtered_acc)
             print(filtered_lbs)
 
-        filtered_mmap_lbs = np.memmap(
-            filtered_lbs,
-            mode=mode,
-            dtype=np.int64,
-            shape=(
-                filtered_n,
-                features_lbs + 2
-            )
+        # written again on every build, in the order of the final windows
+        keep_indices = self.get_lb_indices()
+        self.kept_windows = keep_indices[:, 0]
+
+        final_signal = os.path.join(
+            self.path,
+            'finalData',
+            self.fingerprints['finalData'],
+            'acceleration_signal' + '.mmap'
         )
 
-        if not exists:
+        filtered_mmap_acc = create_windows(filtered_acc, self.acceleration.table[keep_indices[:, 0]], final_signal,
+                                           duration, stage='filteredData', fingerprint=self.fingerprints['filteredData'])
+        self.manifest.set_segments(filtered_acc, self.acc_segments)
+
+        filtered_mmap_lbs = create_mmap(filtered_lbs, (len(keep_indices), features_lbs + 2), np.int64,
+                                        stage='filteredData', fingerprint=self.fingerprints['filteredData'])
+
+        if len(keep_indices):
+            label = self.labels[keep_indices[:, 0], keep_indices[:, 1]]
+            windows = np.arange(len(keep_indices))
+            filtered_mmap_lbs[:] = np.concatenate((keep_indices[:, [2]], windows[:, np.newaxis],
+                                                   keep_indices[:, [1]], label[:, 1:]), axis=1)
+
+        seal_mmap(filtered_lbs, filtered_mmap_lbs)
+        self.manifest.set_segments(filtered_lbs, self.acc_segments)
 
-            for i, index in enumerate(keep_indices):
-                label = self.labels[index[0], index[1]]
-                filtered_mmap_lbs[i][0] = index[2]
-                filtered_mmap_lbs[i][1] = index[0]
-                filtered_mmap_lbs[i][2] = index[1]
-                filtered_mmap_lbs[i][3:] = label[1:]
+        self.acceleration_shape = {
+            'samples': filtered_mmap_acc.shape[0],
+            'duration': duration,
+            'channels': features_acc
+        }
+
+        self.labels_shape = {
+            'samples': filtered_mmap_lbs.shape[0],
+            'channels': filtered_mmap_lbs.shape[1]
+        }
 
         return filtered_mmap_acc, filtered_mmap_lbs
 
@@ -1256,19 +1728,20 @@ class buildData:
 
         path = os.path.join(
             self.path,
-            'filteredData'
+            'filteredData',
+            self.fingerprints['filteredData']
         )
 
         if not os.path.exists(path):
             os.makedirs(path)
-            exists = False
 
-        else:
-            exists = True
+        unseal_folder(path)
 
-        acceleration, labels = self.labels_filter(path, exists)
+        with self.profile.measure('labels_filter'):
+            acceleration, labels = self.labels_filter(path)
 
-        location = self.loc_filter(path, exists)
+        with self.profile.measure('loc_filter'):
+            location = self.loc_filter(path)
 
         if self.verbose:
             print('FILTERING DATA FOR FEEDING TO THE MODEL')
@@ -1289,6 +1762,9 @@ class buildData:
             print(self.labels_shape)
 
         self.save_shapes()
+        self.save_index()
+
+        self.seal_stage(path)
 
         return acceleration, labels, location
 
@@ -1298,5 +1774,14 @@ class buildData:
 
         self.wordify()
 
-        return self.filter()
+        data = self.filter()
+
+        with self.profile.measure('spectro_tape'):
+            self.spectro_tape()
+
+        self.profile.save(self.path)
+        if self.verbose:
+            print(self.profile.summary())
+
+        return data
 
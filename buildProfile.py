@@ -0,0 +1,158 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# build_profile.json and build_profile.csv, next to data_config.yaml, hold a
+# record of every buildData stage, every day of a per-day stage and every
+# position of a day:
+#   wall      seconds elapsed
+#   cpu       user + system seconds of the process and its reaped workers
+#   read      bytes read from storage, page cache hits are not counted
+#   written   bytes written to storage
+#   peak_rss  peak resident memory in bytes
+# Records of a day or a position are part of the record of their stage.
+
+FIELDS = ['stage', 'user', 'day', 'position', 'wall', 'cpu', 'read', 'written', 'peak_rss']
+
+
+def io_counters():
+    # /proc/self/io also counts the reaped workers
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+
+        return int(counters['read_bytes']), int(counters['write_bytes'])
+
+    except (OSError, KeyError, ValueError):
+        if resource is None:
+            return 0, 0
+
+        usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        return sum(u.ru_inblock for u in usage) * 512, sum(u.ru_oublock for u in usage) * 512
+
+
+def cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def reset_peak():
+    # the peak resident memory restarts from the current one, Linux only
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+
+    except OSError:
+        pass
+
+
+def peak_rss():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+
+    except OSError:
+        pass
+
+    if resource is None:
+        return 0
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class measure:
+    def __init__(self, profile, stage, user, day, position):
+        self.profile = profile
+        self.record = {'stage': stage, 'user': user, 'day': day, 'position': position}
+
+    def __enter__(self):
+        # the peak so far belongs to the enclosing records
+        self.profile.peak(peak_rss())
+        reset_peak()
+
+        self.profile.frames.append(self)
+        self.peak_rss = 0
+        self.read, self.written = io_counters()
+        self.cpu = cpu_time()
+        self.wall = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *exc):
+        read, written = io_counters()
+
+        self.record['wall'] = time.perf_counter() - self.wall
+        self.record['cpu'] = cpu_time() - self.cpu
+        self.record['read'] = read - self.read
+        self.record['written'] = written - self.written
+
+        self.profile.frames.pop()
+        self.record['peak_rss'] = max(self.peak_rss, peak_rss())
+        self.profile.peak(self.record['peak_rss'])
+        self.profile.records.append(self.record)
+
+        return False
+
+
+class buildProfile:
+    def __init__(self):
+        self.records = []
+        self.frames = []
+
+    def measure(self, stage, user='', day='', position=''):
+        return measure(self, stage, user, day, position)
+
+    def peak(self, rss):
+        for frame in self.frames:
+            frame.peak_rss = max(frame.peak_rss, rss)
+
+    def merge(self, records):
+        # records measured by a worker process
+        self.records += records
+        self.peak(max([record['peak_rss'] for record in records] + [0]))
+
+    def stages(self):
+        return [record for record in self.records if not record['user']]
+
+    def save(self, path):
+        with open(os.path.join(path, 'build_profile.json'), 'w') as f:
+            json.dump(self.records, f, indent=4)
+
+        with open(os.path.join(path, 'build_profile.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def summary(self):
+        stages = self.stages()
+        total = sum(record['wall'] for record in stages)
+
+        header = ('stage', 'wall s', '%', 'cpu s', 'read MB', 'written MB', 'peak MB')
+        lines = ['%-22s %9s %6s %9s %10s %10s %10s' % header]
+        for record in stages:
+            lines.append('%-22s %9.2f %6.1f %9.2f %10.1f %10.1f %10.1f' % (
+                record['stage'], record['wall'], 100. * record['wall'] / total if total else 0.,
+                record['cpu'], record['read'] / 1e6, record['written'] / 1e6, record['peak_rss'] / 1e6))
+
+        return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='summary of a buildData profile')
+    parser.add_argument('path', help='data path holding build_profile.json')
+    args = parser.parse_args()
+
+    profile = buildProfile()
+    with open(os.path.join(args.path, 'build_profile.json'), 'r') as f:
+        profile.records = json.load(f)
+
+    print(profile.summary())
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from configParser import Parser
+from buildData import buildData
+from mmapContainer import open_mmap
+
+# an incremental build against a clean one: a day is dropped from srcData,
+# built, put back and built again, so its rows end up last in the flat
+# signals. The window tables, filtered tables and index have to come out
+# the same as those of a clean build, in the same order
+
+
+def link_days(src, dst, skip=None):
+    # srcData of extracted parts with the files of every day linked, but
+    # those of the user/day skip
+    if os.path.exists(dst):
+        shutil.rmtree(dst)
+
+    for root, _, filenames in os.walk(src):
+        relative = os.path.relpath(root, src)
+
+        if skip and relative.replace(os.sep, '/').endswith('/User' + skip):
+            continue
+
+        os.makedirs(os.path.join(dst, relative), exist_ok=True)
+        for filename in filenames:
+            os.symlink(os.path.abspath(os.path.join(root, filename)), os.path.join(dst, relative, filename))
+
+
+def build(path, dataset):
+    args = Parser().get_args()
+    args.data_args['path'] = path
+    args.data_args['dataset'] = dataset
+
+    builder = buildData(args=args, verbose=False)
+    builder()
+
+    return builder.fingerprints
+
+
+def tables(path, fingerprints):
+    # every window table of finalData and filteredData, read row by row
+    found = {}
+
+    for stage in ['finalData', 'filteredData']:
+        folder = os.path.join(path, stage, fingerprints[stage])
+
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith('_signal.mmap') or not filename.endswith('.mmap'):
+                continue
+
+            mmap = open_mmap(os.path.join(folder, filename), mode='r')
+            found[stage + '/' + filename] = np.asarray(mmap[np.arange(mmap.shape[0])])
+
+    with open(os.path.join(path, 'filteredData', fingerprints['filteredData'], 'index.json')) as f:
+        found['filteredData/index.json'] = json.load(f)
+
+    return found
+
+
+if __name__ == "__main__":
+    args = Parser().get_args()
+
+    parser = argparse.ArgumentParser(description='incremental build against a clean build')
+    parser.add_argument('--src', default=os.path.join(args.data_args['path'], 'srcData'),
+                        help='srcData with the extracted parts')
+    parser.add_argument('--day', default=None, help='user/day to drop and add again, the first day if not given')
+    parser.add_argument('--path', default=None, help='work folder, a temporary one if not given')
+    parser.add_argument('--dataset', default=args.data_args['dataset'])
+    cmd = parser.parse_args()
+
+    work = cmd.path if cmd.path else tempfile.mkdtemp()
+    clean = os.path.join(work, 'clean')
+    incremental = os.path.join(work, 'incremental')
+
+    for path in [clean, incremental]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+    link_days(cmd.src, os.path.join(clean, 'srcData'))
+    expected = tables(clean, build(clean, cmd.dataset))
+
+    day = cmd.day
+    if day is None:
+        index = expected['filteredData/index.json']
+        user = sorted(index['files'], key=int)[0]
+        day = user + '/' + index['files'][user][0]
+
+    link_days(cmd.src, os.path.join(incremental, 'srcData'), skip=day)
+    build(incremental, cmd.dataset)
+
+    link_days(cmd.src, os.path.join(incremental, 'srcData'))
+    found = tables(incremental, build(incremental, cmd.dataset))
+
+    different = 0
+    for name in sorted(expected):
+        if name.endswith('.json'):
+            equal = found.get(name) == expected[name]
+
+        else:
+            equal = name in found and found[name].shape == expected[name].shape and \
+                    np.array_equal(found[name], expected[name])
+
+        if not equal:
+            different += 1
+            print(name + ' differs')
+
+    print('%s dropped and added again, %d of %d tables differ' % (day, different, len(expected)))
+
+    if not cmd.path:
+        shutil.rmtree(work)
@@ -0,0 +1,104 @@
+import argparse
+import types
+import numpy as np
+from buildData import buildData
+
+# buildData.get_sampling against the resampler it replaced, on random GPS
+# days with duplicate timestamps and long gaps
+
+
+def while_sampling(x, n, threshold, period):
+    # the previous get_sampling, with samplingThreshold and gpsSamplingRate
+    # as arguments
+
+    sampled = []
+    threshold = threshold * 1000
+    period = period * 1000
+
+    j = 1
+    minDistance = np.inf
+    nextSample = x[0, 0] + period
+    sampled.append(0)
+
+    while True:
+        distance = np.abs((x[j, 0] - nextSample))
+
+        if j == n - 1:
+            if distance <= minDistance:
+                if distance <= threshold:
+                    sampled.append(j)
+
+            else:
+                if minDistance <= threshold:
+                    sampled.append(j - 1)
+
+            return np.array(sampled)
+
+        if distance <= minDistance:
+            minDistance = distance
+            j += 1
+
+        else:
+            if minDistance <= threshold:
+                sampled.append(j - 1)
+                nextSample = x[j - 1, 0] + period
+
+            else:
+
+                sampled.append(-1)
+                nextSample += period
+
+                last = 1
+                while True:
+                    if sampled[-last] != -1:
+                        j = sampled[-last] + 1
+                        break
+
+                    last += 1
+
+            minDistance = np.inf
+
+
+def random_day(rng, period):
+    # fixes about every second, some repeated, with gaps of up to a
+    # hundred periods
+    n = int(rng.integers(2, 3000))
+
+    steps = rng.choice([0, 1000, 1000, 1000, 2000, 30000], size=n - 1) + rng.integers(-300, 300, size=n - 1)
+    steps = np.maximum(steps, 0)
+    gaps = rng.random(n - 1) < 0.005
+    steps[gaps] += rng.integers(2000 * period, 100000 * period, size=np.count_nonzero(gaps))
+
+    x = np.zeros((n, 6))
+    x[:, 0] = 1498118400000 + np.concatenate(([0], np.cumsum(steps)))
+
+    return x
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='get_sampling against the previous resampler')
+    parser.add_argument('--days', default=1000, type=int, help='random days')
+    parser.add_argument('--seed', default=0, type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    builder = buildData.__new__(buildData)
+
+    pairs = [(10, 60), (10, 1), (3, 5), (30, 60), (60, 300), (1, 2)]
+    mismatches = 0
+
+    for i in range(args.days):
+        threshold, period = pairs[i % len(pairs)]
+        builder.data = types.SimpleNamespace(args=types.SimpleNamespace(data_args={'samplingThreshold': threshold}))
+
+        x = random_day(rng, period)
+        n = x.shape[0]
+
+        expected = while_sampling(x, n, threshold, period)
+        sampled = builder.get_sampling(x, n, period)
+
+        if not np.array_equal(expected, sampled):
+            mismatches += 1
+            print('day %d samplingThreshold=%d gpsSamplingRate=%d rows=%d differs' % (i, threshold, period, n))
+
+    print('%d days, %d with different indices' % (args.days, mismatches))
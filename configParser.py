@@ -1,6 +1,11 @@
 import argparse
 import os
 import yaml
+from mmapContainer import fingerprint
+
+# data_args that only change how the data is built, not its content
+RUNTIME_ARGS = ['path', 'src_path', 'workers', 'parser', 'parserThreads', 'tmpStorage',
+                'accSamplingPyramid', 'gpsSamplingPyramid']
 
 class Parser:
     def __init__(self):
@@ -51,4 +56,35 @@ class Parser:
 
         args = self.parser.parse_args(args=[])
 
-        return args
\ No newline at end of file
+        return args
+
+
+def data_fingerprint(data_args, keys=None):
+    if keys is None:
+        keys = [key for key in data_args.keys() if key not in RUNTIME_ARGS]
+
+    return fingerprint({key: data_args.get(key) for key in keys})
+
+
+# data_args each stage of buildData depends on, a stage also depends on the
+# data_args of the stages before it. The sampling folder keeps a file per
+# rate, the rates select the files finalData is built from
+STAGE_ARGS = [
+    ('drop', ['dataset', 'splitDays']),
+    ('sampling', ['samplingThreshold', 'interpolation', 'interpolateThreshold']),
+    ('finalData', ['accSamplingRate', 'gpsSamplingRate', 'accDuration', 'accStride', 'locDuration',
+                   'locStride', 'accBagSize', 'accBagStride', 'precision', 'derivedSignals']),
+    ('filteredData', ['sync', 'majorityVoting', 'majority']),
+    ('spectoTape', ['spectoTape', 'spectoWindow', 'spectoOverlap'])
+]
+
+
+def stage_fingerprint(data_args, stage):
+    keys = []
+    for name, stage_args in STAGE_ARGS:
+        keys += stage_args
+
+        if name == stage:
+            return data_fingerprint(data_args, keys)
+
+    raise ValueError('unknown stage: ' + stage)
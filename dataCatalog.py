@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import zipfile
+from configParser import Parser, stage_fingerprint
+
+# users, days and positions of the dataset, found by scanning srcData
+# (extracted parts or their zip archives), and the index.json written by
+# buildData, next to the filtered arrays, with the sample counts of every
+# user/day/position and the rows of every user/day in each final and
+# filtered array.
+
+PREFIX = 'SHLDataset_preview_v1'
+POSITIONS = ['Torso', 'Hips', 'Bag', 'Hand']
+
+# the hand-picked days of CompleteUser1, the days of srcData that are not
+# listed are left out. Every complete Preview day is used, as before
+COMPLETE_DAYS = {
+    '1': ['010317', '010617', '020317', '020517', '020617', '030317',
+          '030517', '030617', '030717', '040517', '040717', '050517',
+          '050617', '050717', '060317', '060617', '070317', '070617',
+          '080317', '080517', '080617', '090317', '090517', '090617',
+          '100317', '100517', '110517', '120517', '120617', '130317',
+          '130617', '140317', '140617', '150317', '150517', '150617',
+          '160317', '170317', '170517', '190417',
+          '190517', '200317', '200417', '200517', '200617', '210317',
+          '220317', '220517', '220617', '230317', '230517', '230617',
+          '240317', '240417', '240517', '250317', '250417', '250517',
+          '260417', '260517', '260617', '270317', '270417', '270617',
+          '280317', '280417', '280617', '290317', '290517', '290617',
+          '300317', '300517', '300617', '310517']
+}
+
+
+class dataCatalog:
+    def __init__(self, args=None):
+
+        if not args:
+            parser = Parser()
+            args = parser.get_args()
+
+        self.completeData = (args.data_args['dataset'] == 'CompleteUser1')
+
+        # recordings interrupted by a long gap in the Bag motion, buildData
+        # splits them at the gap in day_1 and day_2
+        self.splits = [tuple(entry.split('/')) for entry in args.data_args.get('splitDays', [])]
+
+        path = args.data_args['path']
+        if self.completeData:
+            path = os.path.join(
+                path,
+                'completeData'
+            )
+
+        self.path = path
+        self.srcPath = os.path.join(path, 'srcData')
+        self.indexFile = os.path.join(
+            path,
+            'filteredData',
+            stage_fingerprint(args.data_args, 'filteredData'),
+            'index.json'
+        )
+
+        self.index = {}
+        if os.path.exists(self.indexFile):
+            with open(self.indexFile, 'r') as f:
+                self.index = json.load(f)
+
+        if os.path.exists(self.srcPath):
+            self.files, self.pos = self.scan()
+
+        else:
+            self.files, self.pos = self.index.get('files', {}), self.index.get('pos', [])
+
+        if self.completeData:
+            self.pos = ['Hips']
+
+    def members(self, entry):
+        path = os.path.join(self.srcPath, entry)
+
+        if entry.endswith('.zip'):
+            with zipfile.ZipFile(path) as z:
+                return z.namelist()
+
+        names = []
+        for root, _, filenames in os.walk(path):
+            for filename in filenames:
+                names.append(os.path.relpath(os.path.join(root, filename), path).replace(os.sep, '/'))
+
+        return names
+
+    def scan(self):
+        found = {}
+
+        for entry in sorted(os.listdir(self.srcPath)):
+            match = re.fullmatch(PREFIX + r'_part\d+(\.zip)?', entry)
+
+            if not match:
+                continue
+
+            # an extracted part is preferred to its archive
+            if match.group(1) and os.path.isdir(os.path.join(self.srcPath, entry[:-4])):
+                continue
+
+            for name in self.members(entry):
+                match = re.fullmatch(PREFIX + r'/User(\d+)/(\d{6})/(\w+)\.txt', name)
+
+                if match:
+                    user, day, stem = match.groups()
+                    found.setdefault(user, {}).setdefault(day, set()).add(stem)
+
+        files = {}
+        positions = None
+
+        for user in sorted(found, key=int):
+            for day in sorted(found[user]):
+                stems = found[user][day]
+
+                day_positions = {stem[:-len('_Motion')] for stem in stems
+                                 if stem.endswith('_Motion') and
+                                 stem[:-len('_Motion')] + '_Location' in stems}
+
+                if 'Label' not in stems or not day_positions:
+                    continue
+
+                if self.completeData and day not in COMPLETE_DAYS.get(user, []):
+                    continue
+
+                files.setdefault(user, []).append(day)
+                positions = day_positions if positions is None else positions & day_positions
+
+        positions = positions if positions else set()
+        pos = [position for position in POSITIONS if position in positions] + \
+              sorted(positions - set(POSITIONS))
+
+        return files, pos
+
+    def save_index(self, samples, rows):
+        self.index = {
+            'files': self.files,
+            'pos': self.pos,
+            'samples': samples,
+            'rows': rows
+        }
+
+        tmp = self.indexFile + '.part'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+
+        os.replace(tmp, self.indexFile)
+
+    def find(self, name, user, day):
+        # the [key, user, d, start, stop] entry of user and day, the day
+        # index of the windows or the day name, in the array name
+
+        user = str(int(user))
+
+        for entry in self.index['rows'][name]:
+            if entry[1] != user:
+                continue
+
+            if entry[2] == day or entry[0] == user + '/' + str(day):
+                return entry
+
+        return None
+
+    def rows(self, name, user, day):
+        entry = self.find(name, user, day)
+
+        if entry is None:
+            return 0, 0
+
+        return entry[3], entry[4]
+
+    def source_rows(self, name, other, user, day):
+        # rows in name of the recording day of the windows of user, day in
+        # other: acceleration days split at a gap share their location
+
+        entry = self.find(other, user, day)
+
+        if entry is None:
+            return 0, 0
+
+        return self.rows(name, user, entry[0].split('/')[1].split('_')[0])
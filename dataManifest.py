@@ -0,0 +1,125 @@
+import json
+import os
+from initData import src_fingerprint
+from mmapContainer import fingerprint, validate
+
+# manifest.json, next to the stage folders, remembers what every stage has
+# already built:
+#   days      the fingerprint of the source files of every user/day
+#   stages    per-day stages: the day fingerprint and output files of each day
+#   segments  concatenated stages: the ordered [user/day, fingerprint, d, rows]
+#             blocks of rows of every output file
+#   checksums the checksum of every segment of the files that are appended to
+# so that only new or changed days are processed again. Every variant of a
+# stage is built in its own folder, named after the fingerprint of the
+# data_args it depends on, and has its own records.
+
+
+class dataManifest:
+    def __init__(self, path):
+        self.path = path
+        self.file = os.path.join(path, 'manifest.json')
+
+        self.days = {}
+        self.stages = {}
+        self.segments = {}
+        self.checksums = {}
+
+        if os.path.exists(self.file):
+            try:
+                with open(self.file, 'r') as f:
+                    manifest = json.load(f)
+
+                self.stages = manifest['stages']
+                self.segments = manifest['segments']
+                self.checksums = manifest.get('checksums', {})
+
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def save(self):
+        manifest = {
+            'days': self.days,
+            'stages': self.stages,
+            'segments': self.segments,
+            'checksums': self.checksums
+        }
+
+        tmp = self.file + '.part'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+        os.replace(tmp, self.file)
+
+    @staticmethod
+    def key(user, day):
+        return user + '/' + day
+
+    def set_day(self, user, day, sources):
+        self.days[self.key(user, day)] = fingerprint([src_fingerprint(src) for src in sources])
+
+    def day_fingerprint(self, user, day):
+        # the segments of a day split in stages share its fingerprint
+        return self.days[self.key(user, day.split('_')[0])]
+
+    def done(self, stage, user, day):
+        record = self.stages.get(stage, {}).get(self.key(user, day))
+
+        if record is None or record['fingerprint'] != self.day_fingerprint(user, day):
+            return False
+
+        if all(validate(os.path.join(self.path, file)) is not None
+               for file in record['files']):
+            return True
+
+        del self.stages[stage][self.key(user, day)]
+        return False
+
+    def add(self, stage, user, day, files):
+        self.stages.setdefault(stage, {})[self.key(user, day)] = {
+            'fingerprint': self.day_fingerprint(user, day),
+            'files': [os.path.relpath(file, self.path) for file in files]
+        }
+
+    def get_segments(self, file, check_rows=True):
+        # the segments of a complete output file or an empty list, filtered
+        # files keep the segments of the file they were filtered from
+
+        name = os.path.relpath(file, self.path)
+        segments = self.segments.get(name, [])
+        header = validate(file)
+
+        if header is None:
+            return []
+
+        if check_rows and header['shape'][0] != sum(segment[3] for segment in segments):
+            return []
+
+        return segments
+
+    def set_segments(self, file, segments, checksums=None):
+        name = os.path.relpath(file, self.path)
+        self.segments[name] = segments
+
+        if checksums is None:
+            self.checksums.pop(name, None)
+
+        else:
+            self.checksums[name] = checksums
+
+        self.save()
+
+    def get_checksums(self, file):
+        # the checksum of every recorded segment of file, by segment
+
+        name = os.path.relpath(file, self.path)
+        segments = self.segments.get(name, [])
+        checksums = self.checksums.get(name, [])
+
+        if len(segments) != len(checksums):
+            return {}
+
+        return {json.dumps(segment): crc for segment, crc in zip(segments, checksums)}
+
+    def segment(self, user, day, d, rows):
+        return [self.key(user, day), self.day_fingerprint(user, day), d, int(rows)]
@@ -3,6 +3,7 @@ import random
 import pandas as pd
 from configParser import Parser
 from extractData import extractData
+from dataCatalog import dataCatalog
 from buildData import buildData
 from transformers import *
 from features import *
@@ -39,11 +40,13 @@ class Dataset:
                 bData()
                 del bData
 
+                xData = extractData(self.shl_args)
                 self.acceleration, self.labels, self.location = xData()
 
             else:
                 self.acceleration, self.labels, self.location = xData()
 
+            self.tape = xData.tape()
             del xData
 
         else:
@@ -64,42 +67,20 @@ class Dataset:
                 self.labels, \
                 self.location = xData()
 
+            self.tape = xData.tape()
             del xData
 
+        self.catalog = dataCatalog(self.shl_args)
+
     def initialize(self):
 
         self.complete = (self.shl_args.data_args['dataset'] == 'CompleteUser1')
 
-        if self.complete:
-
-            self.positions = ['Hips']
-            self.positionsDict = {'Hips': 0}
-            self.files = {
-                '1': ['010317', '010617', '020317', '020517', '020617', '030317',
-                      '030517', '030617', '030717', '040517', '040717', '050517',
-                      '050617', '050717', '060317', '060617', '070317', '070617',
-                      '080317', '080517', '080617', '090317', '090517', '090617',
-                      '100317', '100517', '110517', '120517', '120617', '130317',
-                      '130617', '140317', '140617', '150317', '150517', '150617',
-                      '160317', '170317', '170517', '190417',
-                      '190517', '200317', '200417', '200517', '200617', '210317',
-                      '220317', '220517', '220617', '230317', '230517', '230617',
-                      '240317', '240417', '240517', '250317', '250417', '250517',
-                      '260417', '260517', '260617', '270317', '270417', '270617',
-                      '280317', '280417', '280617', '290317', '290517', '290617',
-                      '300317', '300517', '300617', '310517']
-            }
-
-        else:
-            self.positions = ['Torso', 'Hips', 'Bag', 'Hand']
-            self.positionsDict = {
-                'Torso': 0,
-                'Hips': 1,
-                'Bag': 2,
-                'Hand': 3
-            }
+        self.positions = self.catalog.pos
+        self.positionsDict = {position: index for index, position in enumerate(self.positions)}
 
         if self.complete:
+            self.files = self.catalog.files
             self.whichGPS = 'Hips'
 
         else:
@@ -225,7 +206,6 @@ class Dataset:
             if position == self.whichGPS:
 
                 dailyStart = 0
-                NDaily = 0
                 searchStart = 0
 
                 for i, label in enumerate(self.labels):
@@ -236,13 +216,10 @@ class Dataset:
 
                     if i == 0 or user != self.labels[i - 1][-3] or day != self.labels[i - 1][-2]:
 
-                        dailyStart += NDaily
-                        dailyGpsData = self.select_location(user,
-                                                            day,
-                                                            index,
-                                                            dailyStart)
+                        dailyStart, dailyGpsData = self.select_location(user,
+                                                                        day,
+                                                                        index)
 
-                        NDaily = dailyGpsData.shape[0]
                         searchStart = 0
 
                     else:
@@ -286,24 +263,23 @@ class Dataset:
 
         self.accBags, self.lbsBags, self.gpsBags = bagMap['acc'], bagMap['labels'], bagMap['gps']
 
-    def select_location(self, user, day, position, start):
-        output = []
-        found = False
+    def select_location(self, user, day, position):
+        start, stop = self.catalog.source_rows(
+            'filteredData/location_' + self.positions[position] + '.mmap',
+            'filteredData/acceleration.mmap',
+            user,
+            day
+        )
 
-        if user == 3 and day >= 2:
-            day -= 1
+        return start, np.array(self.location[position][start:stop])
 
-        for loc_sample in self.location[position][start:]:
+    def tape_start(self, bag):
+        # the final signal row an acceleration bag starts at, spectrogram
+        # tapes are indexed by it
+        if self.useSpectro and self.tape:
+            return {'start': int(self.acceleration.table[bag[0]])}
 
-            if loc_sample[0, -3] == user and loc_sample[0, -2] == day:
-
-                found = True
-                output.append(loc_sample)
-
-            elif found:
-                break
-
-        return np.array(output)
+        return {}
 
     def init_transformers(self, accTransfer=False, gpsTransfer=False, timeInfo=False):
 
@@ -313,7 +289,8 @@ class Dataset:
                 self.accTfrm = spectrogramTransformer(
                     self.shl_args,
                     accTransfer=accTransfer,
-                    accMIL=self.accMIL
+                    accMIL=self.accMIL,
+                    tape=self.tape
                 )
 
             else:
@@ -387,7 +364,8 @@ class Dataset:
                 if not gpsTransfer:
                     accBag, accTime = self.accTfrm(self.acceleration[self.accBags[bagIndex]],
                                                    is_train=not (is_val or is_test),
-                                                   position=instancePositions, timeInfo=timeInfo)
+                                                   position=instancePositions, timeInfo=timeInfo,
+                                                   **self.tape_start(self.accBags[bagIndex]))
 
                 if not accTransfer:
                     location = self.location[self.positions.index(self.whichGPS)][self.gpsBags[self.whichGPS][bagIndex]]
@@ -693,7 +671,8 @@ class Dataset:
                             accBag, accTime = self.accTfrm(
                                 self.acceleration[self.accBags[index]],
                                 is_train=False,
-                                position=Iposition
+                                position=Iposition,
+                                **self.tape_start(self.accBags[index])
                             )
 
                         if not accTransfer:
@@ -2,8 +2,9 @@ import shutil
 
 import numpy as np
 import os
-from configParser import Parser
-from dataParser import dataParser
+from configParser import Parser, stage_fingerprint
+from dataCatalog import dataCatalog
+from mmapContainer import open_mmap, read_header, sealed_folder, signal_path, validate
 
 class extractData:
     def __init__(self ,args = None):
@@ -22,62 +23,31 @@ class extractData:
                 'completeData'
             )
 
+        self.fingerprint = stage_fingerprint(self.shl_args.data_args, 'filteredData')
+
         self.path_data = os.path.join(
             self.path,
-            'filteredData'
+            'filteredData',
+            self.fingerprint
         )
 
-        path_config = os.path.join(
-            self.path,
-            'data_config.yaml'
-        )
 
-        if os.path.exists(self.path_data) and os.path.exists(path_config):
-            dp = dataParser()
-            self.args = dp(path_config)
+        self.catalog = dataCatalog(self.shl_args)
+        self.pos = self.catalog.pos
+
+        self.filenames = ['acceleration.mmap', 'labels.mmap'] + \
+                         ['location_' + position + '.mmap' for position in self.pos]
+
+        if sealed_folder(self.path_data) and \
+                all(validate(os.path.join(self.path_data, filename),
+                             fingerprint=self.fingerprint) is not None for filename in self.filenames):
             print('Found Data')
             self.found = True
 
         else:
-            print('No filteredData folder or config file')
+            print('No complete filteredData folder or it is stale')
             self.found = False
 
-
-        if self.shl_args.data_args['dataset'] == 'CompleteUser1':
-
-            self.pos = ['Hips']
-
-            self.files = {
-                '1': ['010317','010617','020317','020517','020617','030317',
-                      '030517','030617','030717','040517','040717','050517',
-                      '050617','050717','060317','060617','070317','070617',
-                      '080317','080517','080617','090317','090517','090617',
-                      '100317','100517','110517','120517','120617','130317',
-                      '130617','140317','140617','150317','150517','150617',
-                      '160317','170317','170517','190417',
-                      '190517','200317','200417','200517','200617','210317',
-                      '220317','220517','220617','230317','230517','230617',
-                      '240317','240417','240517','250317','250417','250517',
-                      '260417','260517','260617','270317','270417','270617',
-                      '280317','280417','280617','290317','290517','290617',
-                      '300317','300517','300617','310517']
-            }
-
-        else:
-
-            self.pos = [
-                'Torso',
-                'Hips',
-                'Bag',
-                'Hand'
-            ]
-
-            self.files = {
-                '1': ['220617', '260617', '270617'],
-                '2': ['140617', '140717', '180717'],
-                '3': ['030717', '070717', '140617']
-            }
-
     def __call__(self,
                  delete_dst = False,
                  delete_tmp = False,
@@ -110,8 +80,22 @@ class extractData:
 
             z = os.path.join(self.path , 'finalData')
 
+            # the filtered windows are read from the final signals
+            signals = []
+            for filename in self.filenames:
+                header = read_header(os.path.join(self.path_data, filename))
+
+                if header and 'windows' in header['attrs']:
+                    signals.append(os.path.normpath(signal_path(os.path.join(self.path_data, filename), header)))
+
             try:
-                shutil.rmtree(z)
+                for root, dirs, filenames in os.walk(z, topdown=False):
+                    for filename in filenames:
+                        if os.path.normpath(os.path.join(root, filename)) not in signals:
+                            os.remove(os.path.join(root, filename))
+
+                    if root != z and not os.listdir(root):
+                        os.rmdir(root)
             except OSError as e:
                 print ("Error: %s - %s." % (e.filename, e.strerror))
 
@@ -126,12 +110,7 @@ class extractData:
                 'location_' + position +'.mmap'
             )
 
-            pos_loc = np.memmap(
-                filename=loc_mmap_path,
-                mode='r+',
-                shape=self.get_shape(self.args.shapes['location'][position]),
-                dtype=np.float64
-            )
+            pos_loc = open_mmap(loc_mmap_path, mode='r+', fingerprint=self.fingerprint)
 
             location.append(pos_loc)
 
@@ -140,45 +119,44 @@ class extractData:
             'acceleration.mmap'
         )
 
-        acceleration = np.memmap(
-            filename=acc_mmap_path,
-            mode='r+',
-            shape=self.get_shape(self.args.shapes['acceleration']),
-            dtype=np.float64
-        )
+        acceleration = open_mmap(acc_mmap_path, mode='r+', fingerprint=self.fingerprint)
 
         lbs_mmap_path = os.path.join(
             self.path_data,
             'labels.mmap'
         )
 
-        labels = np.memmap(
-            filename=lbs_mmap_path,
-            mode='r+',
-            shape=self.get_shape(self.args.shapes['labels'], is_lbs=True),
-            dtype=np.int64
-        )
+        labels = open_mmap(lbs_mmap_path, mode='r+', fingerprint=self.fingerprint)
 
         return acceleration , labels , location
 
 
-    def take_user_day(self, x, u, d):
-        ret = []
-        stop = False
-        for el in x:
+    def tape(self):
+        # the spectrograms buildData computed along every day of the signal
+        # of the filtered acceleration windows, None if there are none
 
-            if el[0, -3] == u and el[0, -2] == d:
-                stop = True
-                ret.append(el)
+        if not self.found or not self.shl_args.data_args.get('spectoTape'):
+            return None
 
-            elif stop:
-                break
+        fingerprint = stage_fingerprint(self.shl_args.data_args, 'spectoTape')
+        path = os.path.join(self.path, 'spectoTape', fingerprint)
 
-        return np.array(ret)
+        if not sealed_folder(path):
+            return None
 
-    def get_shape(self ,x ,is_lbs=False):
-        if not is_lbs:
-            return (x['samples'] ,x['duration'] ,x['channels'])
+        rows_path = os.path.join(path, 'tape_rows.mmap')
+        rows = open_mmap(rows_path, mode='r', fingerprint=fingerprint)
+        attrs = read_header(rows_path)['attrs']
 
-        else:
-            return (x['samples'] ,x['channels'])
\ No newline at end of file
+        return {
+            'tape': open_mmap(os.path.join(path, 'tape.mmap'), mode='r', fingerprint=fingerprint),
+            'rows': np.array(rows),
+            'signals': attrs['signals'],
+            'nperseg': attrs['nperseg'],
+            'noverlap': attrs['noverlap']
+        }
+
+    def take_user_day(self, x, u, d, name='filteredData/acceleration.mmap'):
+        start, stop = self.catalog.rows(name, u, d)
+
+        return np.array(x[start:stop])
@@ -1,10 +1,22 @@
 import numpy as np
 import pandas as pd
 import os
-import subprocess
+import copy
+import io
+import mmap
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor
 from configParser import Parser
+from dataCatalog import dataCatalog
+from mmapContainer import HEADER_SIZE, make_header, write_header, seal_mmap, \
+    open_mmap, validate, source_fingerprint
 
 NROWS = None
+BLOCK_SIZE = 1 << 25  # bytes per block of the block parser
 
 
 class initData:
@@ -43,39 +55,10 @@ class initData:
 
         self.completeData = (self.args.data_args['dataset'] == 'CompleteUser1')
 
-        if self.completeData:
-
-            self.pos = ['Hips']
-
-            self.files = {
-                '1': ['010317','010617','020317','020517','020617','030317',
-                      '030517','030617','030717','040517','040717','050517',
-                      '050617','050717','060317','060617','070317','070617',
-                      '080317','080517','080617','090317','090517','090617',
-                      '100317','100517','110517','120517','120617','130317',
-                      '130617','140317','140617','150317','150517','150617',
-                      '160317','170317','170517','190417',
-                      '190517','200317','200417','200517','200617','210317',
-                      '220317','220517','220617','230317','230517','230617',
-                      '240317','240417','240517','250317','250417','250517',
-                      '260417','260517','260617','270317','270417','270617',
-                      '280317','280417','280617','290317','290517','290617',
-                      '300317','300517','300617','310517']
-            }
-
-        else:
-            self.pos = [
-                'Torso',
-                'Hips',
-                'Bag',
-                'Hand'
-            ]
-
-            self.files = {
-                '1': ['220617', '260617', '270617'],
-                '2': ['140617', '140717', '180717'],
-                '3': ['030717', '070717', '140617']
-            }
+        self.catalog = dataCatalog(self.args)
+        self.pos = self.catalog.pos
+        self.files = copy.deepcopy(self.catalog.files)
+        self.splits = self.catalog.splits
 
         path = self.args.data_args['path']
         if self.completeData:
@@ -111,232 +94,327 @@ class initData:
         lbs = self.extract_labels()
         return loc, acc, lbs
 
-    def extract_features(self):
-
-        location = {}
-        acceleration = {}
+    def get_src(self, user, day, name):
+        # the parts of the dataset are read from their zip archives when
+        # they have not been extracted
         filename = 'SHLDataset_preview_v1'
 
-        self.n_acc = {}
-        self.n_loc = {}
+        part = os.path.join(
+            self.srcPath,
+            filename + '_part' + user
+        )
 
-        for user, days in self.files.items():
-            location[user] = {}
-            acceleration[user] = {}
+        if not os.path.exists(part) and os.path.exists(part + '.zip'):
+            part = part + '.zip'
+
+        return os.path.join(
+            part,
+            filename,
+            'User' + user,
+            day,
+            name
+        )
 
-            self.n_acc[user] = {}
-            self.n_loc[user] = {}
+    def day_sources(self, user, day):
+        sources = [self.get_src(user, day, 'Label.txt')]
 
-            for day in days:
-                location[user][day] = {}
-                acceleration[user][day] = {}
+        for position in self.pos:
+            sources.append(self.get_src(user, day, position + '_Location.txt'))
+            sources.append(self.get_src(user, day, position + '_Motion.txt'))
 
-                self.n_acc[user][day] = {}
-                self.n_loc[user][day] = {}
+        return sources
 
-                for position in self.pos:
+    def run(self, jobs):
+        workers = self.args.data_args.get('workers', 1)
+        parser = self.args.data_args.get('parser', 'pandas')
+        threads = self.args.data_args.get('parserThreads', 1)
+        jobs = [(*job, parser, threads) for job in jobs]
 
-                    self.src_loc = os.path.join(
-                        self.srcPath,
-                        filename + '_part' + user,
-                        filename,
-                        'User' + user,
-                        day,
-                        position + '_Location.txt',
-                    )
+        if self.verbose:
+            for job in jobs:
+                print(job[1])
 
-                    self.src_mot = os.path.join(
-                        self.srcPath,
-                        filename + '_part' + user,
-                        filename,
-                        'User' + user,
-                        day,
-                        position + '_Motion.txt'
-                    )
+        if not workers or workers <= 1 or len(jobs) <= 1:
+            return [to_mmap(*job) for job in jobs]
 
-                    stdout = subprocess.Popen(
-                        "wc -l < " + self.src_loc,
-                        shell=True,
-                        stdout=subprocess.PIPE)
+        with Pool(processes=min(workers, len(jobs))) as pool:
+            return pool.starmap(to_mmap, jobs)
 
-                    lines_loc, _ = stdout.communicate()
-                    lines_loc = int(lines_loc)
-                    self.n_loc[user][day][position] = lines_loc
+    def extract_features(self):
 
-                    stdout = subprocess.Popen(
-                        "wc -l < " + self.src_mot,
-                        shell=True,
-                        stdout=subprocess.PIPE)
+        location = {}
+        acceleration = {}
 
-                    lines_mot, _ = stdout.communicate()
-                    lines_mot = int(lines_mot)
-                    self.n_acc[user][day][position] = lines_mot
+        self.n_acc = {}
+        self.n_loc = {}
+
+        jobs = []
+        keys = []
+
+        for user, days in self.files.items():
+            for day in days:
+                for position in self.pos:
+
+                    src_loc = self.get_src(user, day, position + '_Location.txt')
+                    src_mot = self.get_src(user, day, position + '_Motion.txt')
 
                     dst_filename = 'user' + user + '_' + day + '_' + position
 
-                    self.dst_loc = os.path.join(
+                    dst_loc = os.path.join(
                         self.path,
                         dst_filename + '_location' + '.mmap'
                     )
 
-                    self.dst_mot = os.path.join(
+                    dst_mot = os.path.join(
                         self.path,
                         dst_filename + '_motion' + '.mmap'
                     )
 
-                    if os.path.exists(self.dst_loc) and os.path.exists(self.dst_mot):
-                        location[user][day][position], \
-                        acceleration[user][day][position] = self.to_mmap_features(
-                            shape_loc=(lines_loc, 5),
-                            shape_mot=(lines_mot, 4),
-                            exists=True
-                        )
+                    jobs.append((src_loc, dst_loc, [0, 3, 4, 5, 6], np.float64))
+                    jobs.append((src_mot, dst_mot, [0, 1, 2, 3], np.float64))
+                    keys.append((user, day, position, dst_loc, dst_mot))
 
-                        continue
+        lines = self.run(jobs)
 
-                    location[user][day][position], \
-                    acceleration[user][day][position] = self.to_mmap_features(
-                        shape_loc=(lines_loc, 5),
-                        shape_mot=(lines_mot, 4)
-                    )
+        for i, (user, day, position, dst_loc, dst_mot) in enumerate(keys):
+            lines_loc, lines_mot = lines[2 * i], lines[2 * i + 1]
+
+            location.setdefault(user, {}).setdefault(day, {})
+            acceleration.setdefault(user, {}).setdefault(day, {})
+            self.n_loc.setdefault(user, {}).setdefault(day, {})
+            self.n_acc.setdefault(user, {}).setdefault(day, {})
+
+            self.n_loc[user][day][position] = lines_loc
+            self.n_acc[user][day][position] = lines_mot
+
+            location[user][day][position] = open_mmap(dst_loc, mode='r+')
+            acceleration[user][day][position] = open_mmap(dst_mot, mode='r+')
 
         return location, acceleration
 
     def extract_labels(self):
         labels = {}
 
-        filename = 'SHLDataset_preview_v1'
+        jobs = []
+        keys = []
 
         for user, days in self.files.items():
-            labels[user] = {}
-
             for day in days:
 
-                self.src_lbs = os.path.join(
-                    self.srcPath,
-                    filename + '_part' + user,
-                    filename,
-                    'User' + user,
-                    day,
-                    'Label.txt',
-                )
-
-                stdout = subprocess.Popen(
-                    "wc -l < " + self.src_lbs,
-                    shell=True,
-                    stdout=subprocess.PIPE)
-
-                lines_lbs, _ = stdout.communicate()
-                lines_lbs = int(lines_lbs)
+                src_lbs = self.get_src(user, day, 'Label.txt')
 
                 dst_filename = 'user' + user + '_' + \
                                day
 
-                self.dst_lbs = os.path.join(
+                dst_lbs = os.path.join(
                     self.path,
                     dst_filename + '_labels' + '.mmap'
                 )
 
-                if os.path.exists(self.dst_lbs):
-                    labels[user][day] = self.to_mmap_labels(
-                        shape_lbs=(int(lines_lbs), 2),
-                        exists=True
-                    )
+                jobs.append((src_lbs, dst_lbs, [0, 1], np.int64))
+                keys.append((user, day, dst_lbs))
 
-                    continue
+        self.run(jobs)
 
-                labels[user][day] = self.to_mmap_labels(
-                    shape_lbs=(lines_lbs, 2)
-                )
+        for user, day, dst_lbs in keys:
+            labels.setdefault(user, {})
+
+            labels[user][day] = open_mmap(dst_lbs, mode='r+')
 
         return labels
 
-    def to_mmap_labels(self, shape_lbs, dtype_lbs=np.int64, exists=False):
 
-        if self.verbose:
-            print(self.dst_lbs)
+def split_zip(src):
+    # archive and member of a source inside a zip archive, path/part.zip/member
+    index = src.find('.zip' + os.sep)
 
-        if exists:
-            # print(self.dst_lbs)
+    if index == -1:
+        return None, None
 
-            mmap_lbs = np.memmap(
-                self.dst_lbs,
-                mode='r+',
-                shape=shape_lbs,
-                dtype=dtype_lbs
-            )
+    return src[:index + 4], src[index + 5:].replace(os.sep, '/')
 
-            return mmap_lbs
 
-        else:
-            mmap_lbs = np.memmap(
-                self.dst_lbs,
-                mode='w+',
-                shape=shape_lbs,
-                dtype=dtype_lbs
-            )
+@lru_cache(maxsize=None)
+def zip_members(archive, mtime):
+    with zipfile.ZipFile(archive) as z:
+        return {info.filename: (info.file_size, info.CRC) for info in z.infolist()}
 
-            offset = 0
-            for batch in pd.read_csv(self.src_lbs, delimiter=' ',
-                                     chunksize=5000, header=None, nrows=NROWS):
-                mmap_lbs[offset: offset + batch.shape[0]] = batch.iloc[:, [0, 1]]
-                offset += batch.shape[0]
 
-            return mmap_lbs
+def src_fingerprint(src):
+    # archived members are identified by their size and crc
+    archive, member = split_zip(src)
 
-    def to_mmap_features(self,
-                         shape_loc,
-                         shape_mot,
-                         dtype_loc=np.float64,
-                         dtype_mot=np.float64,
-                         exists=False):
+    if archive is None:
+        return source_fingerprint(src)
 
-        if self.verbose:
-            print(self.dst_loc)
-            print(self.dst_mot)
+    size, crc = zip_members(archive, os.stat(archive).st_mtime_ns)[member]
+    return 'zip-' + str(size) + '-' + '%08x' % crc
 
-        if exists:
 
-            mmap_loc = np.memmap(
-                self.dst_loc,
-                mode='r+',
-                dtype=dtype_loc,
-                shape=shape_loc
-            )
+@contextmanager
+def open_src(src):
+    archive, member = split_zip(src)
 
-            mmap_acc = np.memmap(
-                self.dst_mot,
-                mode='r+',
-                dtype=dtype_mot,
-                shape=shape_mot
-            )
+    if archive is None:
+        with open(src, 'rb') as f:
+            yield f
 
-        else:
+    else:
+        with zipfile.ZipFile(archive) as z, z.open(member) as f:
+            yield f
 
-            mmap_loc = np.memmap(
-                self.dst_loc,
-                mode='w+',
-                dtype=dtype_loc,
-                shape=shape_loc
-            )
 
-            mmap_acc = np.memmap(
-                self.dst_mot,
-                mode='w+',
-                dtype=dtype_mot,
-                shape=shape_mot
-            )
+def parse_pandas(src, dst, columns, dtype, threads=1, offset=0):
+    lines = 0
+
+    with open(dst, 'wb') as f, open_src(src) as s:
+        f.write(bytes(offset))
+        for batch in pd.read_csv(s, delimiter=' ',
+                                 chunksize=5000, header=None, nrows=NROWS):
+            f.write(np.ascontiguousarray(batch.values[:, columns], dtype=dtype).tobytes())
+            lines += batch.shape[0]
+
+    return lines
+
+
+def parse_block(block, columns, dtype, rows):
+    # pandas' C tokenizer and float conversion release the GIL, so that the
+    # blocks of parserThreads threads are parsed in parallel, and give the
+    # same values as parse_pandas
+    frame = pd.read_csv(io.BytesIO(block), delimiter=' ', header=None, usecols=columns, nrows=rows)
+    return np.ascontiguousarray(frame[columns].values, dtype=dtype)
+
+
+def parse_stream(src, dst, columns, dtype, threads=1, offset=0):
+    # sources that can not be memory-mapped, archived members, are
+    # decompressed in newline aligned blocks which are parsed concurrently
+    # and appended in order to the destination
+    lines = 0
+    pending = deque()
+
+    def write(f, future):
+        nonlocal lines
+        values = future.result()
+        if NROWS is not None:
+            values = values[:NROWS - lines]
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        lines += values.shape[0]
+
+    with open(dst, 'wb') as f, open_src(src) as s, \
+            ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        f.write(bytes(offset))
+
+        rest = b''
+        while NROWS is None or lines < NROWS:
+            data = s.read(BLOCK_SIZE)
+            block = rest + data
+
+            if data:
+                end = block.rfind(b'\n') + 1
+                block, rest = block[:end], block[end:]
+
+            rows = block.count(b'\n') + (1 if block and not block.endswith(b'\n') else 0)
+            if rows:
+                pending.append(executor.submit(parse_block, block, columns, dtype, rows))
+
+            while pending and (len(pending) > 2 * threads or not data):
+                write(f, pending.popleft())
+
+            if not data:
+                break
+
+        for future in pending:
+            future.cancel()
+
+    return lines
+
+
+def parse_blocks(src, dst, columns, dtype, threads=1, offset=0):
+    # the memory-mapped source is cut into newline aligned blocks which are
+    # parsed concurrently, only the needed columns, straight into their
+    # slice of the destination memmap
+    if split_zip(src)[0] is not None:
+        return parse_stream(src, dst, columns, dtype, threads, offset)
+
+    size = os.path.getsize(src)
+
+    if size == 0:
+        with open(dst, 'wb') as f:
+            f.write(bytes(offset))
+        return 0
+
+    with open(src, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+
+        bounds = [0]
+        while bounds[-1] < size:
+            end = buffer.find(b'\n', bounds[-1] + BLOCK_SIZE)
+            bounds.append(size if end == -1 else end + 1)
+
+        rows = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            block = np.frombuffer(buffer, dtype=np.uint8, count=end - start, offset=start)
+            rows.append(int(np.count_nonzero(block == ord('\n'))))
+            del block
+
+        if buffer[size - 1:size] != b'\n':
+            rows[-1] += 1
+
+        offsets = np.concatenate(([0], np.cumsum(rows)))
+        lines = int(offsets[-1]) if NROWS is None else min(int(offsets[-1]), NROWS)
+
+        with open(dst, 'wb') as f:
+            f.truncate(offset + lines * len(columns) * np.dtype(dtype).itemsize)
+
+        if not lines:
+            return 0
+
+        out = np.memmap(
+            dst,
+            mode='r+',
+            dtype=dtype,
+            shape=(lines, len(columns)),
+            offset=offset
+        )
+
+        def parse(i):
+            n = min(rows[i], lines - offsets[i])
+            if n <= 0:
+                return
+
+            out[offsets[i]: offsets[i] + n] = parse_block(buffer[bounds[i]:bounds[i + 1]], columns, dtype, n)
+
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+            list(executor.map(parse, range(len(rows))))
+
+        out.flush()
+        del out
+
+    return lines
+
+
+parsers = {
+    'pandas': parse_pandas,
+    'block': parse_blocks
+}
+
+
+def to_mmap(src, dst, columns, dtype=np.float64, parser='pandas', threads=1):
+    # runs in a worker process when data_args['workers'] > 1,
+    # every job owns its own dst file
+    fingerprint = src_fingerprint(src)
+    header = validate(dst, stage='dstData', fingerprint=fingerprint)
+
+    if header is not None:
+        return header['shape'][0]
 
-            offset = 0
-            for batch in pd.read_csv(self.src_loc, delimiter=' ',
-                                     chunksize=5000, header=None, nrows=NROWS):
-                mmap_loc[offset: offset + batch.shape[0]] = batch.iloc[:, [0, 3, 4, 5, 6]]
-                offset += batch.shape[0]
+    # single pass over src: the parser sizes the destination while filling
+    # it, so there is no need to count the lines of src beforehand
+    tmp = dst + '.part'
+    lines = parsers[parser](src, tmp, columns, dtype, threads, offset=HEADER_SIZE)
 
-            offset = 0
-            for batch in pd.read_csv(self.src_mot, delimiter=' ',
-                                     chunksize=5000, header=None, nrows=NROWS):
-                mmap_acc[offset: offset + batch.shape[0]] = batch.values[:, [0, 1, 2, 3]]
-                offset += batch.shape[0]
+    write_header(tmp, make_header((lines, len(columns)), dtype, 'dstData', fingerprint))
+    seal_mmap(tmp)
+    os.replace(tmp, dst)
 
-        return mmap_loc, mmap_acc
+    return lines
@@ -0,0 +1,739 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# .mmap container: a fixed size header followed by the raw C-ordered buffer.
+# The header is MAGIC, the length of a json document and the document itself
+# (shape, dtype, stage, fingerprint, checksum, attrs), zero padded to
+# HEADER_SIZE so that the buffer stays page aligned for np.memmap.
+
+HEADER_SIZE = 4096
+MAGIC = b'TMDMMAP\x01'
+CHUNK = 1 << 26
+CHUNK_ROWS = 1 << 16  # rows per compressed chunk
+CACHED_CHUNKS = 4
+SEALED = 'sealed.json'  # completion marker of a stage folder
+
+# threads that (de)compress chunks, see set_threads, and the pool of the
+# current process
+THREADS = os.cpu_count()
+pool = None
+
+
+def set_threads(threads):
+    global THREADS
+    THREADS = max(1, threads)
+
+
+def chunk_map(function, items):
+    # a forked process does not inherit the threads of its parent's pool
+    global pool
+
+    items = list(items)
+    if THREADS <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    if pool is None or pool[:2] != (os.getpid(), THREADS):
+        pool = (os.getpid(), THREADS, ThreadPoolExecutor(max_workers=THREADS))
+
+    return list(pool[2].map(function, items))
+
+
+def fingerprint(values):
+    return hashlib.sha1(
+        json.dumps(values, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    return str(stat.st_size) + '-' + str(stat.st_mtime_ns)
+
+
+def write_header(path, header):
+    document = json.dumps(header).encode()
+    length = len(MAGIC) + 4 + len(document)
+
+    if length > HEADER_SIZE:
+        raise ValueError('mmap header too large: ' + path)
+
+    with open(path, 'r+b') as f:
+        f.write(MAGIC + len(document).to_bytes(4, 'little') + document + bytes(HEADER_SIZE - length))
+
+
+def read_header(path):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+
+        if len(head) < HEADER_SIZE or head[:len(MAGIC)] != MAGIC:
+            return None
+
+        length = int.from_bytes(head[len(MAGIC):len(MAGIC) + 4], 'little')
+        return json.loads(head[len(MAGIC) + 4:len(MAGIC) + 4 + length])
+
+    except (OSError, ValueError):
+        return None
+
+
+def nbytes(header):
+    return int(np.prod(header['shape'], dtype=np.int64)) * np.dtype(header['dtype']).itemsize
+
+
+def payload(header):
+    # bytes after the header, compressed containers keep their size in attrs
+    if 'chunks' in header['attrs']:
+        return header['attrs']['chunks']['size']
+
+    return nbytes(header)
+
+
+def checksum(path, size, start=0):
+    crc = 0
+    with open(path, 'rb') as f:
+        f.seek(HEADER_SIZE + start)
+        while size > 0:
+            data = f.read(min(CHUNK, size))
+            if not data:
+                break
+            crc = zlib.crc32(data, crc)
+            size -= len(data)
+
+    return '%08x' % crc
+
+
+def gf2_times(matrix, vector):
+    total = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[i]
+        vector >>= 1
+        i += 1
+
+    return total
+
+
+def gf2_square(matrix):
+    return [gf2_times(matrix, row) for row in matrix]
+
+
+def combine_checksums(first, second, size):
+    # the checksum of two blocks from their own checksums and the size of
+    # the second one, as zlib's crc32_combine: the first crc is run through
+    # size zero bytes by squaring the one zero bit operator
+
+    first, second = int(first, 16), int(second, 16)
+
+    if size <= 0:
+        return '%08x' % first
+
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = gf2_square(odd)
+    odd = gf2_square(even)
+
+    while True:
+        even = gf2_square(odd)
+        if size & 1:
+            first = gf2_times(even, first)
+        size >>= 1
+        if not size:
+            break
+
+        odd = gf2_square(even)
+        if size & 1:
+            first = gf2_times(odd, first)
+        size >>= 1
+        if not size:
+            break
+
+    return '%08x' % (first ^ second)
+
+
+def validate(path, stage=None, fingerprint=None, verify=False):
+    # the header of a complete, up to date container or None
+
+    header = read_header(path)
+
+    if header is None or header['checksum'] is None:
+        return None
+
+    if stage is not None and header['stage'] != stage:
+        return None
+
+    if fingerprint is not None and header['fingerprint'] != fingerprint:
+        return None
+
+    if os.path.getsize(path) != HEADER_SIZE + payload(header):
+        return None
+
+    if verify and checksum(path, payload(header)) != header['checksum']:
+        return None
+
+    if 'windows' in header['attrs'] and \
+            validate(signal_path(path, header), fingerprint=header['attrs']['windows']['fingerprint'],
+                     verify=verify) is None:
+        return None
+
+    return header
+
+
+def signal_path(path, header):
+    # the signal of a window table is stored relative to its folder
+    return os.path.join(os.path.dirname(path), header['attrs']['windows']['signal'])
+
+
+def coding_dtype(coding):
+    return np.dtype([(field['name'], field['dtype'], (field['channels'],)) for field in coding])
+
+
+class codedArray:
+    # array view of a structured memmap whose fields hold groups of channels
+    # in reduced precision, integer fields optionally scaled. Values are
+    # decoded to dtype, scaled fields reserve their minimum value for NaN.
+
+    def __init__(self, raw, coding, dtype=np.float64):
+        self.raw = raw
+        self.coding = coding
+        self.fields = []
+
+        channel = 0
+        for field in coding:
+            scale = field.get('scale')
+            scale = None if scale is None else np.array(scale, dtype=np.float64)
+            self.fields.append((field['name'], channel, field['channels'], scale))
+            channel += field['channels']
+
+        self.channels = channel
+        self.shape = raw.shape + (channel,)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(self.shape[0]):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        return self[()] if dtype is None else self[()].astype(dtype)
+
+    def flush(self):
+        if isinstance(self.raw, np.memmap):
+            self.raw.flush()
+
+    def split(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if len(key) == self.ndim:
+            return key[:-1], key[-1]
+
+        return key, slice(None)
+
+    def field(self, channel):
+        for name, start, channels, scale in self.fields:
+            if start <= channel < start + channels:
+                return name, channel - start, scale
+
+    def decode(self, values, scale, sub=slice(None)):
+        if scale is None:
+            return values.astype(self.dtype)
+
+        decoded = values * scale[sub]
+        decoded[values == np.iinfo(values.dtype).min] = np.nan
+        return decoded
+
+    def __getitem__(self, key):
+        lead, channel = self.split(key)
+        records = np.asarray(self.raw[lead])
+
+        if isinstance(channel, (int, np.integer)):
+            name, sub, scale = self.field(range(self.channels)[channel])
+            return self.decode(records[name][..., sub], scale, sub)
+
+        out = np.empty(records.shape + (self.channels,), dtype=self.dtype)
+        for name, start, channels, scale in self.fields:
+            out[..., start:start + channels] = self.decode(records[name], scale)
+
+        return out[..., channel]
+
+    def __setitem__(self, key, value):
+        lead, channel = self.split(key)
+        channels = np.arange(self.channels)[channel]
+        value = np.asarray(value, dtype=np.float64)
+
+        if np.ndim(channels) == 0:
+            self.set_channel(lead, int(channels), value)
+            return
+
+        for j, c in enumerate(channels):
+            self.set_channel(lead, int(c), value[..., j] if value.ndim else value)
+
+    def set_channel(self, lead, channel, value):
+        name, sub, scale = self.field(channel)
+        values = self.raw[name]
+
+        if scale is not None:
+            info = np.iinfo(values.dtype)
+            nans = np.isnan(value)
+            value = np.clip(np.rint(np.nan_to_num(value / scale[sub])), info.min + 1, info.max)
+            value = np.where(nans, info.min, value)
+
+        values[lead + (Ellipsis, sub)] = value
+
+
+class chunkedArray:
+    # container whose rows are stored in zlib compressed chunks of
+    # CHUNK_ROWS rows followed by the int64 table of the chunk offsets.
+    # Chunks are stored column by column and byte-shuffled so that bytes of
+    # equal significance of a column are next to each other, which run
+    # length encoding compresses well and fast. A new array is written front
+    # to back: a chunk is kept in memory until a write starts past it, then
+    # compressed and appended to the file, flush compresses the rest and
+    # writes the table. An existing one is read only and decompresses the
+    # chunks it is indexed with, keeping the last few
+
+    def __init__(self, path, header, new=False):
+        self.path = path
+        self.header = header
+        self.shape = tuple(header['shape'])
+        self.dtype = np.dtype(header['dtype'])
+        self.ndim = len(self.shape)
+        self.rows = header['attrs']['chunks']['rows']
+        self.new = new
+        # chunk_map decompresses chunks from the threads of the pool
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+        if new:
+            # chunks written to the file, their offsets, and the chunks
+            # still in memory
+            self.written = 0
+            self.offsets = [0]
+            self.pending = {}
+
+        else:
+            n = -(-self.shape[0] // self.rows)
+            with open(path, 'rb') as f:
+                f.seek(HEADER_SIZE + header['attrs']['chunks']['table'])
+                self.offsets = np.frombuffer(f.read(8 * (n + 1)), dtype='<i8')
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(self.shape[0]):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        return self[()] if dtype is None else self[()].astype(dtype)
+
+    def compress(self, chunk):
+        columns = np.ascontiguousarray(chunk.reshape(chunk.shape[0], -1).T)
+        shuffled = np.ascontiguousarray(columns.view(np.uint8).reshape(-1, self.dtype.itemsize).T)
+
+        compressor = zlib.compressobj(1, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+        return compressor.compress(shuffled.tobytes()) + compressor.flush()
+
+    def decompress(self, c):
+        with self.lock:
+            if c in self.cache:
+                self.cache.move_to_end(c)
+                return self.cache[c]
+
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER_SIZE + int(self.offsets[c]))
+            data = zlib.decompress(f.read(int(self.offsets[c + 1] - self.offsets[c])))
+
+        rows = min(self.rows, self.shape[0] - c * self.rows)
+        shuffled = np.frombuffer(data, dtype=np.uint8).reshape(self.dtype.itemsize, -1)
+        columns = np.ascontiguousarray(shuffled.T).view(self.dtype).reshape(-1, rows)
+        chunk = np.ascontiguousarray(columns.T).reshape((rows,) + self.shape[1:])
+
+        with self.lock:
+            self.cache[c] = chunk
+            if len(self.cache) > CACHED_CHUNKS:
+                self.cache.popitem(last=False)
+
+        return chunk
+
+    def chunks(self, first, last):
+        return chunk_map(self.decompress, range(first, last))
+
+    def __getitem__(self, key):
+        if self.new:
+            raise IOError('compressed mmap is write only until flushed: ' + self.path)
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if not key or key[0] is Ellipsis:
+            key = (slice(None),) + key
+
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, (int, np.integer)):
+            i = range(self.shape[0])[first]
+            return self.decompress(i // self.rows)[(i % self.rows,) + rest]
+
+        if isinstance(first, slice) and first.step in (None, 1):
+            start, stop, _ = first.indices(self.shape[0])
+            if stop <= start:
+                return np.zeros((0,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest]
+
+            c0 = start // self.rows
+            rows = np.concatenate(self.chunks(c0, (stop - 1) // self.rows + 1))
+            return rows[(slice(start - c0 * self.rows, stop - c0 * self.rows),) + rest]
+
+        index = np.arange(self.shape[0])[first]
+        out = np.empty(index.shape + self.shape[1:], dtype=self.dtype)
+        for c in np.unique(index // self.rows):
+            mask = index // self.rows == c
+            out[mask] = self.decompress(c)[index[mask] - c * self.rows]
+
+        return out[(slice(None),) + rest]
+
+    def chunk(self, c):
+        if c not in self.pending:
+            self.pending[c] = np.zeros((min(self.rows, self.shape[0] - c * self.rows),) + self.shape[1:],
+                                       dtype=self.dtype)
+
+        return self.pending[c]
+
+    def write_chunks(self, last):
+        # compresses and appends the chunks before last, unwritten rows are 0
+        chunks = [self.chunk(c) for c in range(self.written, last)]
+
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER_SIZE + self.offsets[-1])
+            for compressed in chunk_map(self.compress, chunks):
+                f.write(compressed)
+                self.offsets.append(self.offsets[-1] + len(compressed))
+
+        for c in range(self.written, last):
+            del self.pending[c]
+
+        self.written = max(self.written, last)
+
+    def __setitem__(self, key, value):
+        if not self.new:
+            raise IOError('compressed mmap is read only: ' + self.path)
+
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if not key or key[0] is Ellipsis:
+            key = (slice(None),) + key
+
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, (int, np.integer)):
+            first = range(self.shape[0])[first]
+            index = np.array([first])
+            value = np.asarray(value, dtype=self.dtype)[np.newaxis]
+
+        elif isinstance(first, slice) and first.step in (None, 1):
+            index = None
+
+        else:
+            index = np.arange(self.shape[0])[first]
+
+        if index is None:
+            start, stop, _ = first.indices(self.shape[0])
+            count = stop - start
+
+        else:
+            start, stop = (int(index.min()), int(index.max()) + 1) if index.size else (0, 0)
+            count = index.size
+
+        if stop <= start:
+            return
+
+        if start // self.rows < self.written:
+            raise IOError('compressed mmap is written front to back: ' + self.path)
+
+        self.write_chunks(start // self.rows)
+
+        # a value given for every row written is split between the chunks
+        value = np.asarray(value, dtype=self.dtype)
+        ndim = np.zeros((1,) + self.shape[1:], dtype=self.dtype)[(slice(None),) + rest].ndim
+        rows = value.ndim == ndim and value.shape[0] == count
+
+        for c in range(start // self.rows, (stop - 1) // self.rows + 1):
+            chunk = self.chunk(c)
+            low = c * self.rows
+
+            if index is None:
+                a, b = max(start, low), min(stop, low + chunk.shape[0])
+                chunk[(slice(a - low, b - low),) + rest] = value[a - start: b - start] if rows else value
+
+            else:
+                mask = index // self.rows == c
+                chunk[(index[mask] - low,) + rest] = value[mask] if rows else value
+
+    def flush(self):
+        if not self.new:
+            return
+
+        self.write_chunks(-(-self.shape[0] // self.rows))
+        offsets = np.array(self.offsets, dtype='<i8')
+
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER_SIZE + int(offsets[-1]))
+            f.write(offsets.tobytes())
+            f.truncate()
+
+        self.header['attrs']['chunks']['table'] = int(offsets[-1])
+        self.header['attrs']['chunks']['size'] = int(offsets[-1]) + offsets.nbytes
+        write_header(self.path, self.header)
+
+        self.offsets = offsets
+        self.new = False
+
+
+class windowedArray:
+    # (windows, duration, channels) array of the windows of a flat signal
+    # container, the table holds the signal row each window starts at.
+    # Windows of a plain signal are strided views of it when they are
+    # evenly spaced, any other key gathers the rows of its windows
+
+    def __init__(self, table, signal, duration):
+        self.table = table
+        self.signal = signal
+        self.duration = duration
+        self.shape = (table.shape[0], duration) + tuple(signal.shape[1:])
+        self.ndim = len(self.shape)
+        self.dtype = signal.dtype
+        self.coding = getattr(signal, 'coding', None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for i in range(self.shape[0]):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        return self[:] if dtype is None else self[:].astype(dtype)
+
+    def flush(self):
+        if isinstance(self.table, np.memmap):
+            self.table.flush()
+
+    def windows(self, starts):
+        if isinstance(self.signal, np.ndarray) and starts.size:
+            step = int(starts[1] - starts[0]) if starts.size > 1 else 0
+
+            if step >= 0 and np.all(np.diff(starts) == step):
+                return np.lib.stride_tricks.as_strided(
+                    self.signal[int(starts[0]):],
+                    shape=(starts.size, self.duration) + self.signal.shape[1:],
+                    strides=(step * self.signal.strides[0],) + self.signal.strides,
+                    writeable=False
+                )
+
+        return self.signal[starts[:, np.newaxis] + np.arange(self.duration)]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if not key or key[0] is Ellipsis:
+            key = (slice(None),) + key
+
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, (int, np.integer)):
+            start = int(self.table[first])
+            return self.signal[start: start + self.duration][rest]
+
+        starts = np.asarray(self.table[first], dtype=np.int64)
+
+        # rows of the windows, paired with the windows unless they are a slice
+        if rest and (isinstance(rest[0], (int, np.integer)) or
+                     not isinstance(first, slice) and isinstance(rest[0], (list, np.ndarray))):
+            rows = starts + np.arange(self.duration)[rest[0]]
+            return self.signal[rows][(slice(None),) * rows.ndim + rest[1:]]
+
+        return self.windows(starts)[(slice(None),) + rest]
+
+
+def as_mmap(path, mode, header):
+    if 'chunks' in header['attrs']:
+        return chunkedArray(path, header)
+
+    if 'windows' in header['attrs']:
+        shape = tuple(header['shape'])
+        table = np.memmap(path, mode=mode, dtype=header['dtype'], shape=shape, offset=HEADER_SIZE) \
+            if nbytes(header) else np.zeros(shape, dtype=header['dtype'])
+        signal = open_mmap(signal_path(path, header), mode=mode,
+                           fingerprint=header['attrs']['windows']['fingerprint'])
+
+        return windowedArray(table, signal, header['attrs']['windows']['duration'])
+
+    shape = tuple(header['shape'])
+    coding = header['attrs'].get('coding')
+    dtype = coding_dtype(coding) if coding else np.dtype(header['dtype'])
+
+    if not nbytes(header):
+        mmap = np.zeros(shape, dtype=dtype)
+
+    else:
+        mmap = np.memmap(
+            path,
+            mode=mode,
+            dtype=dtype,
+            shape=shape,
+            offset=HEADER_SIZE
+        )
+
+    return codedArray(mmap, coding, header['attrs']['dtype']) if coding else mmap
+
+
+def make_header(shape, dtype=np.float64, stage='', fingerprint='', attrs=None):
+    return {
+        'shape': [int(s) for s in shape],
+        'dtype': np.dtype(dtype).str,
+        'stage': stage,
+        'fingerprint': fingerprint,
+        'checksum': None,
+        'attrs': attrs if attrs else {}
+    }
+
+
+def create_mmap(path, shape, dtype=np.float64, stage='', fingerprint='', attrs=None, coding=None,
+                chunks=None):
+    # with a coding the last axis of shape is made of its fields' channels,
+    # with chunks the container is compressed in chunks of that many rows
+
+    if coding:
+        attrs = dict(attrs if attrs else {}, coding=coding, dtype=np.dtype(dtype).str)
+        shape, dtype = shape[:-1], coding_dtype(coding)
+
+    if chunks:
+        attrs = dict(attrs if attrs else {}, chunks={'rows': chunks, 'codec': 'zlib', 'table': 0, 'size': 0})
+        header = make_header(shape, dtype, stage, fingerprint, attrs)
+
+        with open(path, 'wb') as f:
+            f.truncate(HEADER_SIZE)
+
+        write_header(path, header)
+
+        return chunkedArray(path, header, new=True)
+
+    header = make_header(shape, dtype, stage, fingerprint, attrs)
+
+    with open(path, 'wb') as f:
+        f.truncate(HEADER_SIZE + nbytes(header))
+
+    write_header(path, header)
+
+    return as_mmap(path, 'r+', header)
+
+
+def create_windows(path, starts, signal, duration, stage='', fingerprint=''):
+    # sealed window table of the windows of duration rows starting at the
+    # starts rows of the sealed signal container
+
+    attrs = {'windows': {
+        'signal': os.path.relpath(signal, os.path.dirname(path)),
+        'fingerprint': read_header(signal)['fingerprint'],
+        'duration': int(duration)
+    }}
+
+    mmap = create_mmap(path, (len(starts),), np.int64, stage=stage, fingerprint=fingerprint, attrs=attrs)
+    mmap.table[:] = starts
+    seal_mmap(path, mmap)
+
+    return mmap
+
+
+def seal_mmap(path, mmap=None, attrs=None, crc=None):
+    # marks a fully written container as complete, crc is the checksum of
+    # the payload when the caller already knows it
+
+    if mmap is not None and hasattr(mmap, 'flush'):
+        mmap.flush()
+
+    header = read_header(path)
+    if attrs:
+        header['attrs'].update(attrs)
+    header['checksum'] = crc if crc is not None else checksum(path, payload(header))
+    write_header(path, header)
+
+
+def resize_mmap(path, rows):
+    # grows or shrinks the first axis of a container keeping its leading
+    # rows, the container has to be sealed again afterwards
+
+    header = read_header(path)
+    header['shape'][0] = int(rows)
+    header['checksum'] = None
+    write_header(path, header)
+
+    with open(path, 'r+b') as f:
+        f.truncate(HEADER_SIZE + nbytes(header))
+
+    return as_mmap(path, 'r+', header)
+
+
+def seal_folder(path, files):
+    # marks a folder as complete once all of files are, sealed.json keeps
+    # the checksum of every file and of the signal of every window table
+
+    checksums = {}
+    for file in files:
+        header = read_header(file)
+        checksums[os.path.relpath(file, path)] = header['checksum']
+
+        if 'windows' in header['attrs']:
+            signal = signal_path(file, header)
+            checksums[os.path.relpath(signal, path)] = read_header(signal)['checksum']
+
+    tmp = os.path.join(path, SEALED + '.part')
+    with open(tmp, 'w') as f:
+        json.dump(checksums, f, indent=1)
+
+    os.replace(tmp, os.path.join(path, SEALED))
+
+
+def unseal_folder(path):
+    # before any file of the folder is written again
+    try:
+        os.remove(os.path.join(path, SEALED))
+
+    except FileNotFoundError:
+        pass
+
+
+def sealed_folder(path):
+    try:
+        with open(os.path.join(path, SEALED), 'r') as f:
+            checksums = json.load(f)
+
+    except (OSError, ValueError):
+        return False
+
+    for name, value in checksums.items():
+        header = validate(os.path.join(path, name))
+
+        if header is None or header['checksum'] != value:
+            return False
+
+    return True
+
+
+def open_mmap(path, mode='r+', stage=None, fingerprint=None, verify=False):
+    header = validate(path, stage=stage, fingerprint=fingerprint, verify=verify)
+
+    if header is None:
+        raise IOError('stale, truncated or incomplete mmap: ' + path)
+
+    return as_mmap(path, mode, header)
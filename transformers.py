@@ -36,6 +36,7 @@ class temporalTransformer:
         self.snl = shl_args.train_args['acc_signals']
         self.augmentations = shl_args.train_args['acc_augmentation']
         self.freq = int(1. / shl_args.data_args['accSamplingRate'])
+        self.derived = shl_args.data_args.get('derivedSignals', False)
         self.length = shl_args.train_args['accDuration']
         self.stride = shl_args.train_args['accBagStride']
         self.channels = len(shl_args.train_args['acc_signals'])
@@ -102,6 +103,11 @@ class temporalTransformer:
         if timeInfo:
             time = acceleration[:, :, -3:]
 
+        # Acc_norm and Jerk built with the data, unless the axes are augmented
+        derived = self.derived and not (is_train and self.augmentations)
+        if derived:
+            positions = (acceleration.shape[2] - 3) // 5
+
         if is_train and self.augmentations:
 
             for augmentation in zip(self.augmentations):
@@ -138,10 +144,24 @@ class temporalTransformer:
 
             else:
 
-                if thisSignal == 'Acc_norm':
+                if thisSignal == 'Acc_norm' and derived:
+
+                    signal = np.array([acceleration[i, :, 3 * positions + pos] for i, pos in position])
+
+                elif thisSignal == 'Acc_norm':
 
                     signal = np.sqrt(np.sum(accXYZ ** 2, axis=2))
 
+                elif thisSignal == 'Jerk' and derived:
+
+                    signal = np.array([acceleration[i, :, 4 * positions + pos] for i, pos in position])
+
+                    if self.preprocessing:
+                        signal = signal[:, :-1]
+
+                    else:
+                        signal[:, -1] = 0.
+
                 elif thisSignal == 'Jerk':
 
                     J = np.array(
@@ -201,7 +221,8 @@ class spectrogramTransformer:
                  shl_args,
                  out_size=(48, 48),
                  accTransfer=False,
-                 accMIL=False):
+                 accMIL=False,
+                 tape=None):
 
         self.freq = int(1. / shl_args.data_args['accSamplingRate'])
         self.nperseg = int(shl_args.train_args['specto_window'] * self.freq)
@@ -238,6 +259,49 @@ class spectrogramTransformer:
         elif self.syncing == 'Future':
             self.pivot = 0
 
+        # spectrograms precomputed along every day, see extractData.tape,
+        # used if they were computed with the same window
+        self.tape = None
+        if tape and not self.mySpectro and tape['nperseg'] == self.nperseg and \
+                tape['noverlap'] == self.noverlap and all(s in tape['signals'] for s in self.snl):
+            self.tape = tape
+            self.hop = self.nperseg - self.noverlap
+
+            # frequencies and times of the spectrogram of an instance
+            self.tape_axes = {}
+            for thisSignal in self.snl:
+                length = self.length - 1 if thisSignal == 'Jerk' else self.length
+                self.tape_axes[thisSignal] = spectrogram(np.zeros(length),
+                                                         fs=self.freq,
+                                                         nperseg=self.nperseg,
+                                                         noverlap=self.noverlap)[:2]
+
+    def tape_rows(self, start, position):
+        # tape row of the first spectrum of every instance, None unless all
+        # instances start a multiple of hop rows into their day
+
+        rows = self.tape['rows']
+
+        if self.transfer and not self.MIL:
+            starts = np.array([start + self.pivot * self.stride])
+
+        else:
+            starts = start + np.array([instance for instance, _ in position]) * self.stride
+
+        days = np.searchsorted(rows[:, 0], starts, side='right') - 1
+        offsets = starts - rows[days, 0]
+
+        if np.any(offsets % self.hop):
+            return None
+
+        return rows[days, 1] + offsets // self.hop
+
+    def from_tape(self, thisSignal, rows, position):
+        s = self.tape['signals'].index(thisSignal)
+        spectra = self.tape_axes[thisSignal][1].size
+
+        return np.array([self.tape['tape'][row: row + spectra, s, pos].T for row, (_, pos) in zip(rows, position)])
+
     def log_inter(self, spectrograms, freq, time):
 
         samples = spectrograms.shape[0]
@@ -300,10 +364,11 @@ class spectrogramTransformer:
 
         return self.bagSize * self.posPerInstance, self.length, 3
 
-    def __call__(self, acceleration, is_train=True, position=None, timeInfo=False):
+    def __call__(self, acceleration, is_train=True, position=None, timeInfo=False, start=None):
 
         masking = None
         outputs = None
+        rows = None
 
         if self.transfer and not self.MIL:
             acceleration = np.array([acceleration[0][self.pivot * self.stride: self.pivot * self.stride + self.length]])
@@ -314,9 +379,17 @@ class spectrogramTransformer:
                 [acceleration[0][i * self.stride: i * self.stride + self.length] for i in range(self.bagSize)]
             )
 
-        signals = self.temp_tfrm(acceleration,
-                                 is_train=is_train,
-                                 position=position)
+        # the tape holds the spectrograms of the signals of the stored axes
+        if self.tape is not None and start is not None and not (is_train and self.temp_tfrm.augmentations):
+            rows = self.tape_rows(start, position)
+
+        if rows is None:
+            signals = self.temp_tfrm(acceleration,
+                                     is_train=is_train,
+                                     position=position)
+
+        else:
+            signals = dict.fromkeys(self.snl)
 
         del acceleration
 
@@ -343,6 +416,13 @@ class spectrogramTransformer:
                         _, _, Sxx = my_tvs2(signal, wsize=nfft, num_of_windows=out_t, nfft=nfft)
                         thisSpectrogram[i, :, :] = Sxx
 
+            elif rows is not None:
+
+                f, t = self.tape_axes[thisSignal]
+                thisSpectrogram = self.from_tape(thisSignal, rows, position)
+
+                thisSpectrogram = self.log_inter(thisSpectrogram, f, t)
+
             else:
 
                 f, t, thisSpectrogram = spectrogram(signals[thisSignal],
@@ -358,7 +438,7 @@ class spectrogramTransformer:
             if self.logPower:
                 np.log(thisSpectrogram + 1e-10, dtype=np.float64, out=thisSpectrogram)
 
-            if self.plot:
+            if self.plot and rows is None:
                 rand = np.random.randint(0, 1000)
                 if rand == 1:
                     f, t, spectro = spectrogram(signals[thisSignal],